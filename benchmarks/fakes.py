@@ -0,0 +1,370 @@
+# Built-in libraries
+import os
+import time
+import shutil
+import random
+import hashlib
+import threading
+from uuid import uuid4
+from types import SimpleNamespace
+from collections import defaultdict
+
+# 3rd part libraries
+import numpy as np
+import openai
+
+
+class Latency(object):
+    """
+    Sleeps `base + per_item * items` seconds and raises `error` with probability `error_rate`.
+    """
+    def __init__(self, base: float = 0.0, per_item: float = 0.0, error_rate: float = 0.0, error=None) -> None:
+        self.base = base
+        self.per_item = per_item
+        self.error_rate = error_rate
+        self.error = error or RuntimeError
+        self.rng = random.Random(0)
+        self.lock = threading.Lock()
+
+    def wait(self, items: int = 1) -> None:
+        with self.lock:
+            fail = self.rng.random() < self.error_rate
+        time.sleep(self.base + self.per_item * items)
+        if fail:
+            raise self.error("injected error")
+
+
+class StageTimer(object):
+    """
+    Accumulates busy seconds and calls per named stage, from any thread.
+    """
+    def __init__(self) -> None:
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+
+    def wrap(self, stage: str, function):
+        def timed(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started_at)
+        return timed
+
+    def wrap_iterator(self, stage: str, function):
+        def timed(*args, **kwargs):
+            iterator = iter(function(*args, **kwargs))
+            while True:
+                started_at = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self.add(stage, time.perf_counter() - started_at)
+                    return
+                self.add(stage, time.perf_counter() - started_at)
+                yield item
+        return timed
+
+    def reset(self) -> None:
+        with self.lock:
+            self.seconds.clear()
+            self.calls.clear()
+
+
+def fake_embedding(text: str, dimension: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeOpenAIEmbedding(object):
+    """
+    Stand-in for `openai.Embedding.create`, with rate limit errors injected.
+    """
+    def __init__(self, latency: Latency, dimension: int = 1536) -> None:
+        self.latency = latency
+        self.latency.error = openai.error.RateLimitError
+        self.dimension = dimension
+        self.requests = 0
+        self.inputs = 0
+
+    def create(self, input: list[str], model: str, **kwargs) -> dict:
+        self.requests += 1
+        self.inputs += len(input)
+        self.latency.wait(len(input))
+        return {
+            'data': [{'index': i, 'embedding': fake_embedding(text, self.dimension)} for i, text in enumerate(input)],
+            'usage': {'prompt_tokens': sum(len(text.split()) for text in input)}
+        }
+
+
+class FakeWhisper(object):
+    """
+    Stand-in for `openai.Audio.transcribe` returning `text` for every file.
+    """
+    def __init__(self, latency: Latency, text: str) -> None:
+        self.latency = latency
+        self.text = text
+
+    def transcribe(self, model: str, file, **kwargs):
+        self.latency.wait()
+        return SimpleNamespace(text=self.text)
+
+
+class FakePineconeIndex(object):
+    """
+    In-memory stand-in for `pinecone.Index`, with exact cosine search.
+    """
+    def __init__(self, latency: Latency) -> None:
+        self.latency = latency
+        self.namespaces = defaultdict(dict)
+        self.lock = threading.Lock()
+
+    def upsert(self, vectors: list[dict], namespace: str = "", **kwargs) -> dict:
+        self.latency.wait(len(vectors))
+        with self.lock:
+            for vector in vectors:
+                self.namespaces[namespace][vector['id']] = vector
+        return {'upserted_count': len(vectors)}
+
+    def delete(self, ids: list[str] = None, delete_all: bool = False, namespace: str = "", **kwargs) -> dict:
+        self.latency.wait()
+        with self.lock:
+            if delete_all:
+                self.namespaces.pop(namespace, None)
+            else:
+                for vector_id in ids or []:
+                    self.namespaces[namespace].pop(vector_id, None)
+        return {}
+
+    def query(self, vector: list[float] = None, top_k: int = 4, namespace: str = "",
+              include_metadata: bool = True, include_values: bool = False, **kwargs) -> dict:
+        self.latency.wait()
+        with self.lock:
+            vectors = list(self.namespaces[namespace].values())
+        if not vectors:
+            return {'matches': []}
+        matrix = np.asarray([item['values'] for item in vectors], dtype=np.float32)
+        scores = matrix @ np.asarray(vector, dtype=np.float32)
+        best = np.argsort(-scores)[:top_k]
+        return {'matches': [{
+            'id': vectors[i]['id'],
+            'score': float(scores[i]),
+            'metadata': vectors[i].get('metadata', {}) if include_metadata else {},
+            'values': vectors[i]['values'] if include_values else []
+        } for i in best]}
+
+    def describe_index_stats(self, **kwargs) -> dict:
+        with self.lock:
+            return {'namespaces': {name: {'vector_count': len(vectors)} for name, vectors in self.namespaces.items()}}
+
+    def vector_count(self, namespace: str) -> int:
+        with self.lock:
+            return len(self.namespaces.get(namespace, {}))
+
+
+class FakeS3Client(object):
+    """
+    Stand-in for the boto3 S3 client, storing objects under a local directory.
+    """
+    def __init__(self, directory: str, latency: Latency) -> None:
+        self.directory = directory
+        self.latency = latency
+
+    def _path(self, bucket: str, key: str) -> str:
+        path = os.path.join(self.directory, bucket or "bucket", key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, **kwargs) -> None:
+        self.latency.wait()
+        shutil.copyfile(Filename, self._path(Bucket, Key))
+
+    def put_object(self, Body: bytes, Bucket: str, Key: str, **kwargs) -> dict:
+        self.latency.wait()
+        with open(self._path(Bucket, Key), 'wb') as f_out:
+            f_out.write(Body)
+        return {}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        self.latency.wait()
+        return {'Body': open(self._path(Bucket, Key), 'rb')}
+
+    def copy_object(self, CopySource: dict, Bucket: str, Key: str, **kwargs) -> dict:
+        self.latency.wait()
+        shutil.copyfile(self._path(CopySource['Bucket'], CopySource['Key']), self._path(Bucket, Key))
+        return {}
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs) -> dict:
+        path = self._path(Bucket, Key)
+        if os.path.exists(path):
+            os.remove(path)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod: str, Params: dict, **kwargs) -> str:
+        return "file://" + self._path(Params['Bucket'], Params['Key'])
+
+
+class FakeResponse(object):
+    # Mirrors postgrest's APIResponse: `.data`, and `data, count = response` unpacking
+    def __init__(self, data: list[dict]) -> None:
+        self.data = data
+        self.count = None
+
+    def __iter__(self):
+        yield ('data', self.data)
+        yield ('count', self.count)
+
+
+class FakeSupabaseQuery(object):
+    def __init__(self, client: "FakeSupabaseClient", table: str) -> None:
+        self.client = client
+        self.table = table
+        self.operation = 'select'
+        self.payload = None
+        self.filters = []
+        self.order_by = None
+        self.limit_count = None
+
+    def select(self, columns: str = '*', **kwargs) -> "FakeSupabaseQuery":
+        self.operation = 'select'
+        return self
+
+    def insert(self, payload) -> "FakeSupabaseQuery":
+        self.operation = 'insert'
+        self.payload = payload if isinstance(payload, list) else [payload]
+        return self
+
+    def update(self, payload: dict) -> "FakeSupabaseQuery":
+        self.operation = 'update'
+        self.payload = payload
+        return self
+
+    def delete(self) -> "FakeSupabaseQuery":
+        self.operation = 'delete'
+        return self
+
+    def eq(self, column: str, value) -> "FakeSupabaseQuery":
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column: str, value) -> "FakeSupabaseQuery":
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def in_(self, column: str, values: list) -> "FakeSupabaseQuery":
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "FakeSupabaseQuery":
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count: int) -> "FakeSupabaseQuery":
+        self.limit_count = count
+        return self
+
+    def execute(self) -> FakeResponse:
+        self.client.latency.wait()
+        with self.client.lock:
+            rows = self.client.tables[self.table]
+            if self.operation == 'insert':
+                rows.extend(dict(row) for row in self.payload)
+                return FakeResponse([dict(row) for row in self.payload])
+
+            matched = [row for row in rows if all(condition(row) for condition in self.filters)]
+            if self.operation == 'update':
+                for row in matched:
+                    row.update(self.payload)
+            elif self.operation == 'delete':
+                self.client.tables[self.table] = [row for row in rows if row not in matched]
+
+            if self.order_by:
+                column, desc = self.order_by
+                matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            if self.limit_count is not None:
+                matched = matched[:self.limit_count]
+            return FakeResponse([dict(row) for row in matched])
+
+
+def append_chat_message(client: "FakeSupabaseClient", params: dict) -> dict | None:
+    # Mirrors the append_chat_message stored procedure
+    chat = next((chat for chat in client.tables['chats'] if chat['id'] == params['p_chat_id']), None)
+    if chat is None:
+        return None
+    chat['last_message_seq'] = chat.get('last_message_seq', 0) + 1
+    message = {'id': str(uuid4()), 'chat_id': chat['id'], 'seq': chat['last_message_seq'],
+               'role': params['p_role'], 'content': params['p_content'], 'created_at': time.time()}
+    client.tables['chat_messages'].append(message)
+    return dict(message, _id=str(message['seq']))
+
+
+class FakeSupabaseClient(object):
+    """
+    Stand-in for the supabase `Client` table and rpc APIs, backed by in-memory lists.
+    """
+    def __init__(self, latency: Latency) -> None:
+        self.latency = latency
+        self.tables = defaultdict(list)
+        self.rpc_handlers = {'append_chat_message': append_chat_message}
+        self.rpc_calls = defaultdict(int)
+        self.lock = threading.RLock()
+
+    def table(self, name: str) -> FakeSupabaseQuery:
+        return FakeSupabaseQuery(self, name)
+
+    def rpc(self, name: str, params: dict) -> SimpleNamespace:
+        def execute():
+            self.latency.wait()
+            with self.lock:
+                self.rpc_calls[name] += 1
+                handler = self.rpc_handlers.get(name)
+                return FakeResponse(handler(self, params) if handler else None)
+        return SimpleNamespace(execute=execute)
+
+
+def fake_llm_response(output_message: str) -> dict:
+    return {
+        'error': False,
+        'model_name': 'fake',
+        'output_message': output_message,
+        'openai_callback': SimpleNamespace(total_tokens=0, prompt_tokens=0, completion_tokens=0, total_cost=0),
+        'error_code': None,
+        'error_message': None,
+        'chain_type': 'stuff',
+        'prompt_template': '',
+        'vectorstore': 'fake',
+        'temperature': 0,
+        'chat_model': 'fake',
+    }
+
+
+def new_file(user_id: str, name: str) -> tuple[dict, dict]:
+    """
+    Builds the `files` and `chats` rows File.create_file would insert.
+    """
+    file_id = str(uuid4())
+    chat_id = str(uuid4())
+    file = {
+        'id': file_id,
+        'name': name,
+        'original_name': name,
+        'user_id': user_id,
+        'chat_id': chat_id,
+        'status': 'Carregando',
+        'is_deleted': False,
+        'audio_seconds': 0,
+        'created_at': time.time(),
+        'wix_download_url': None,
+        's3_raw_file_key': f"user_id={user_id}/file={file_id}/{name}",
+        's3_vectors_key': f"user_id={user_id}/file={file_id}/vectors.maiavec",
+    }
+    chat = {'id': chat_id, 'user_id': user_id, 'file_id': file_id, 'messages': [],
+            'namespace': f"{user_id}.{chat_id}", 'is_archived': False}
+    return file, chat
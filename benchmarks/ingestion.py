@@ -0,0 +1,294 @@
+"""
+Ingestion benchmark.
+
+Runs the real `embed()` and `transcribe()` code against local stand-ins for
+OpenAI, Pinecone, S3 and Supabase over a corpus of generated PDFs, and reports
+pages/sec, chunks/sec, peak RSS and busy time per stage.
+
+Usage:
+    python -m benchmarks.ingestion --pages 5,50,200
+    python -m benchmarks.ingestion --pages 50 --embedding-latency 0.3 --embedding-error-rate 0.05
+    python -m benchmarks.ingestion --json results.json
+    python -m benchmarks.ingestion --baseline results.json --tolerance 0.2
+"""
+
+# Built-in libraries
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import resource
+import threading
+from types import SimpleNamespace
+
+# 3rd part libraries
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, PageBreak
+
+# Local libraries
+from benchmarks.fakes import (Latency, StageTimer, FakeOpenAIEmbedding, FakeWhisper, FakePineconeIndex,
+                              FakeS3Client, FakeSupabaseClient, new_file)
+
+BENCHMARK_USER_ID = "00000000-0000-0000-0000-000000000000"
+WORDS = ("contrato cláusula parte pagamento prazo rescisão multa obrigação garantia vigência "
+         "responsabilidade confidencialidade foro acordo documento anexo valor data assinatura "
+         "empresa serviço entrega condição termo aditivo notificação reajuste índice").split()
+WORDS_PER_PAGE = 450
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark ingestion against local fakes.")
+    parser.add_argument("--pages", default="5,50,200", help="Comma separated page counts of the generated PDFs")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per document")
+    parser.add_argument("--transcribe", action="store_true", help="Also benchmark transcribe() for each size")
+    parser.add_argument("--embedding-latency", type=float, default=0.15, help="Seconds per embedding request")
+    parser.add_argument("--embedding-latency-per-input", type=float, default=0.0005, help="Extra seconds per input")
+    parser.add_argument("--embedding-error-rate", type=float, default=0.0, help="Share of requests failing with 429")
+    parser.add_argument("--vector-latency", type=float, default=0.05, help="Seconds per Pinecone request")
+    parser.add_argument("--s3-latency", type=float, default=0.05, help="Seconds per S3 request")
+    parser.add_argument("--supabase-latency", type=float, default=0.02, help="Seconds per Supabase request")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Seconds per chat completion")
+    parser.add_argument("--whisper-latency", type=float, default=5.0, help="Seconds per transcription")
+    parser.add_argument("--warm-cache", action="store_true", help="Keep the embedding cache between runs")
+    parser.add_argument("--dedup", action="store_true", help="Let repeated runs reuse already processed files")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Compare throughput against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput drop against the baseline")
+    return parser.parse_args()
+
+
+def generate_pdf(path: str, pages: int, seed: int) -> None:
+    rng = random.Random(seed)
+    style = getSampleStyleSheet()["Normal"]
+    elements = []
+    for page in range(pages):
+        elements.append(Paragraph(" ".join(rng.choice(WORDS) for _ in range(WORDS_PER_PAGE)), style))
+        if page < pages - 1:
+            elements.append(PageBreak())
+    SimpleDocTemplate(path, pagesize=letter).build(elements)
+
+
+def generate_corpus(directory: str, page_counts: list[int]) -> list[str]:
+    paths = []
+    for seed, pages in enumerate(page_counts):
+        path = os.path.join(directory, f"corpus_{pages}_pages.pdf")
+        generate_pdf(path, pages, seed)
+        paths.append(path)
+    return paths
+
+
+class RSSSampler(threading.Thread):
+    """
+    Samples this process' resident set size to find its peak during a run.
+    """
+    def __init__(self, interval: float = 0.01) -> None:
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_bytes = 0
+        self.stopped = threading.Event()
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def _rss_bytes(self) -> int:
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * self.page_size
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.peak_bytes = max(self.peak_bytes, self._rss_bytes())
+            time.sleep(self.interval)
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return max(self.peak_bytes, self._rss_bytes())
+
+
+def install_fakes(args: argparse.Namespace, workdir: str) -> SimpleNamespace:
+    """
+    Points every external client of the maia package at a local fake.
+
+    Must run before any maia engine module is imported, since they create their
+    clients at import time.
+    """
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ["PINECONE_INDEX"] = "benchmark"
+    os.environ["AWS_S3_RAW_FILE_BUCKET"] = "benchmark"
+    os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(workdir, "embedding_cache")
+    os.environ.pop("REDIS_URL", None)
+
+    import openai
+    from maia.database.supabase import SupabaseClient
+    from maia.database.pinecone import PineconeClient
+    from maia.database.s3 import S3Client
+
+    fakes = SimpleNamespace(timer=StageTimer())
+    fakes.embeddings = FakeOpenAIEmbedding(Latency(args.embedding_latency, args.embedding_latency_per_input,
+                                                   args.embedding_error_rate))
+    fakes.whisper = FakeWhisper(Latency(args.whisper_latency), "")
+    fakes.index = FakePineconeIndex(Latency(args.vector_latency))
+    fakes.s3 = FakeS3Client(os.path.join(workdir, "s3"), Latency(args.s3_latency))
+    fakes.supabase = FakeSupabaseClient(Latency(args.supabase_latency))
+
+    openai.Embedding.create = fakes.embeddings.create
+    openai.Audio.transcribe = fakes.whisper.transcribe
+    SupabaseClient._instance = fakes.supabase
+    PineconeClient._instance = fakes.index
+    S3Client._instance = fakes.s3
+
+    import maia.engines.embed as embed_module
+    import maia.engines.summarize as summarize_module
+    import maia.engines.transcribe as transcribe_module
+    from maia.src.utils import Utils
+
+    def fake_complete(prompt: str, max_tokens: int, model_name: str = None) -> tuple:
+        time.sleep(args.llm_latency)
+        return "Resumo gerado pelo benchmark.", SimpleNamespace(total_tokens=0, prompt_tokens=0,
+                                                                completion_tokens=0, total_cost=0)
+
+    timer = fakes.timer
+    fakes.index.upsert = timer.wrap("upsert", fakes.index.upsert)
+    embed_module.iter_pdf_documents = timer.wrap_iterator("parse", embed_module.iter_pdf_documents)
+    embed_module.embedding_backend.embed_documents = timer.wrap("embed", embed_module.embedding_backend.embed_documents)
+    summarize_module.complete = fake_complete
+    # Run the summary job inline, timed as its own stage
+    embed_module.enqueue_summary = timer.wrap("summary", summarize_module.summarize_file)
+    Utils.move_file_to_s3 = timer.wrap("s3", Utils.move_file_to_s3)
+    Utils.download_raw_file = lambda self, url: open(url[len("file://"):], "rb").read()
+    transcribe_module.transcribe_audio_bytes_like = timer.wrap("transcribe", transcribe_module.transcribe_audio_bytes_like)
+
+    fakes.embed_module = embed_module
+    fakes.transcribe_module = transcribe_module
+    return fakes
+
+
+def reset_embedding_cache(workdir: str, run: int) -> None:
+    from maia.database.embedding_cache import EmbeddingCache, DiskEmbeddingStore, EMBEDDING_CACHE_MAX_ENTRIES
+    EmbeddingCache._instance = EmbeddingCache(DiskEmbeddingStore(os.path.join(workdir, f"embedding_cache_{run}"),
+                                                                 EMBEDDING_CACHE_MAX_ENTRIES))
+
+
+def run_ingestion(fakes: SimpleNamespace, mode: str, source_path: str, pages: int, workdir: str) -> dict:
+    name = os.path.basename(source_path)
+    if mode == "transcribe":
+        name = os.path.splitext(name)[0] + ".mp3"
+    file, chat = new_file(BENCHMARK_USER_ID, name)
+    file['wix_download_url'] = "file://" + source_path
+    file['original_extension'] = "mp3" if mode == "transcribe" else "pdf"
+    fakes.supabase.tables['files'].append(dict(file))
+    fakes.supabase.tables['chats'].append(dict(chat))
+
+    fakes.timer.reset()
+    requests_before = fakes.embeddings.requests
+    sampler = RSSSampler()
+    sampler.start()
+    started_at = time.perf_counter()
+
+    if mode == "transcribe":
+        fakes.transcribe_module.transcribe(BENCHMARK_USER_ID, file)
+    else:
+        # embed() deletes the raw file it is given
+        tmp_raw_file_path = os.path.join(workdir, file['id'] + ".pdf")
+        shutil.copyfile(source_path, tmp_raw_file_path)
+        fakes.embed_module.embed(BENCHMARK_USER_ID, file, tmp_raw_file_path)
+
+    wall_seconds = time.perf_counter() - started_at
+    peak_rss = sampler.stop()
+
+    file_row = next(row for row in fakes.supabase.tables['files'] if row['id'] == file['id'])
+    chunks = fakes.index.vector_count(chat['namespace'])
+    return {
+        'mode': mode,
+        'document': os.path.basename(source_path),
+        'pages': pages,
+        'chunks': chunks,
+        'status': file_row['status'],
+        'wall_seconds': round(wall_seconds, 3),
+        'pages_per_second': round(pages / wall_seconds, 2),
+        'chunks_per_second': round(chunks / wall_seconds, 2),
+        'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+        'children_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        'embedding_requests': fakes.embeddings.requests - requests_before,
+        'stage_seconds': {stage: round(seconds, 3) for stage, seconds in sorted(fakes.timer.seconds.items())},
+    }
+
+
+def print_results(results: list[dict]) -> None:
+    header = f"{'mode':<11}{'document':<26}{'pages':>6}{'chunks':>8}{'wall s':>9}{'pages/s':>9}{'chunks/s':>10}{'rss MB':>8}{'reqs':>6}  stages (busy s)"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        stages = " ".join(f"{stage}={seconds}" for stage, seconds in result['stage_seconds'].items())
+        print(f"{result['mode']:<11}{result['document']:<26}{result['pages']:>6}{result['chunks']:>8}"
+              f"{result['wall_seconds']:>9}{result['pages_per_second']:>9}{result['chunks_per_second']:>10}"
+              f"{result['peak_rss_mb']:>8}{result['embedding_requests']:>6}  {stages}"
+              + ("" if result['status'] == 'Pronto' else f"  STATUS={result['status']}"))
+
+
+def compare_with_baseline(results: list[dict], baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path) as baseline_file:
+        baseline = {(result['mode'], result['document']): result for result in json.load(baseline_file)}
+
+    ok = True
+    for result in results:
+        previous = baseline.get((result['mode'], result['document']))
+        if not previous:
+            continue
+        if result['pages_per_second'] < previous['pages_per_second'] * (1 - tolerance):
+            print(f"REGRESSION {result['mode']} {result['document']}: "
+                  f"{result['pages_per_second']} pages/s vs {previous['pages_per_second']} in baseline")
+            ok = False
+    return ok
+
+
+def main() -> int:
+    args = parse_args()
+    page_counts = [int(pages) for pages in args.pages.split(",")]
+    # Ingestion writes its temporary files to the working directory, so user paths are resolved first
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="maia_benchmark_")
+    os.chdir(workdir)
+
+    fakes = install_fakes(args, workdir)
+    corpus = generate_corpus(workdir, page_counts)
+
+    results = []
+    run = 0
+    for pages, path in zip(page_counts, corpus):
+        modes = ["embed", "transcribe"] if args.transcribe else ["embed"]
+        for mode in modes:
+            if mode == "transcribe":
+                fakes.whisper.text = " ".join(random.Random(pages).choice(WORDS) for _ in range(pages * WORDS_PER_PAGE))
+            for _ in range(args.repeat):
+                if not args.warm_cache:
+                    reset_embedding_cache(workdir, run)
+                if not args.dedup:
+                    for row in fakes.supabase.tables['files']:
+                        row['is_deleted'] = True
+                results.append(run_ingestion(fakes, mode, path, pages, workdir))
+                run += 1
+
+    print_results(results)
+
+    os.chdir(cwd)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if json_path:
+        with open(json_path, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+    ok = compare_with_baseline(results, baseline_path, args.tolerance) if baseline_path else True
+    return 0 if ok and all(result['status'] == 'Pronto' for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+-- Moves chat messages from the chats.messages array to chat_messages; last_message_seq hands out each chat's next seq
+ALTER TABLE public.chats
+    ADD COLUMN last_message_seq INTEGER NOT NULL DEFAULT 0;
+
+INSERT INTO public.chat_messages (id, chat_id, seq, role, content, created_at)
+SELECT COALESCE((message->>'id')::UUID, gen_random_uuid()),
+       chats.id,
+       messages.seq,
+       message->>'role',
+       message->>'content',
+       COALESCE((message->>'created_at')::TIMESTAMPTZ, chats.created_at)
+FROM public.chats
+CROSS JOIN LATERAL jsonb_array_elements(COALESCE(chats.messages::JSONB, '[]'::JSONB))
+    WITH ORDINALITY AS messages(message, seq)
+ON CONFLICT DO NOTHING;
+
+UPDATE public.chats
+SET last_message_seq = COALESCE((SELECT MAX(seq) FROM public.chat_messages WHERE chat_id = chats.id), 0);
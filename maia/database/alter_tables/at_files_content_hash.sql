@@ -0,0 +1,9 @@
+-- Content hash of the uploaded bytes, used to reuse already processed files
+ALTER TABLE public.files
+    ADD COLUMN content_hash TEXT NULL,
+    ADD COLUMN summary TEXT NULL,
+    ADD COLUMN deduplicated_from UUID NULL REFERENCES files (id);
+
+CREATE INDEX files_content_hash_ready_idx
+    ON public.files (content_hash, created_at DESC)
+    WHERE status = 'Pronto';
@@ -0,0 +1,5 @@
+-- Embedding backend each file was ingested with, so queries use the matching model and index
+ALTER TABLE public.files
+    ADD COLUMN embedding_backend TEXT NULL,
+    ADD COLUMN embedding_model TEXT NULL,
+    ADD COLUMN embedding_dimension INTEGER NULL;
@@ -0,0 +1,3 @@
+-- Number of vectors each file was indexed with, used to serve small namespaces from a local index
+ALTER TABLE public.files
+    ADD COLUMN vector_count INTEGER NULL;
@@ -0,0 +1,4 @@
+-- Whether an answer came from the semantic answer cache, and how close the cached question was
+ALTER TABLE public.messages
+    ADD COLUMN answer_cache_hit BOOLEAN NOT NULL DEFAULT FALSE,
+    ADD COLUMN answer_cache_similarity REAL NULL;
@@ -0,0 +1,3 @@
+-- Whether an answer was shared from an identical question in flight; its usage is recorded on the original message
+ALTER TABLE public.messages
+    ADD COLUMN coalesced BOOLEAN NOT NULL DEFAULT FALSE;
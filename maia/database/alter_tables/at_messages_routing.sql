@@ -0,0 +1,5 @@
+-- Pre-flight token count and context size the query engine routed each question with
+ALTER TABLE public.messages
+    ADD COLUMN estimated_prompt_tokens INTEGER NULL,
+    ADD COLUMN context_chunks INTEGER NULL,
+    ADD COLUMN trimmed_chunks INTEGER NULL;
@@ -0,0 +1,192 @@
+# Built-in libraries
+import os
+import json
+import time
+from uuid import uuid4
+
+# 3rd part libraries
+import numpy as np
+
+# Local libraries
+from maia.src.custom_logging import log_function_execution, logger
+from maia.database.redis import Redis
+
+ANSWER_CACHE_PREFIX = "maia:answer_cache"
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+# Questions about the same document often score above 0.9 on ada-002, so only near-paraphrases match
+ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", 0.98))
+ANSWER_CACHE_MAX_ENTRIES_PER_NAMESPACE = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES_PER_NAMESPACE", 200))
+# Looked up before every answer, so an unreachable Redis must fail fast
+ANSWER_CACHE_REDIS_TIMEOUT_SECONDS = float(os.getenv("ANSWER_CACHE_REDIS_TIMEOUT_SECONDS", 1.0))
+
+
+class AnswerCache(object):
+    """
+    Semantic cache of answers per namespace.
+
+    Each namespace keeps two Redis hashes keyed by entry id: the normalized
+    question embeddings as float32 bytes, and the answers. A lookup compares the
+    new question's embedding against the namespace's embeddings and fetches only
+    the answer of the best match, when its cosine similarity is at least
+    ANSWER_CACHE_SIMILARITY_THRESHOLD. Entries expire after ANSWER_CACHE_TTL_SECONDS
+    and a namespace is dropped as a whole when its vectors change. When Redis is
+    unavailable nothing is cached.
+    """
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self) -> None:
+        self.connection = None
+        self.hits = 0
+        self.misses = 0
+        try:
+            self.connection = Redis().create_connection(socket_connect_timeout=ANSWER_CACHE_REDIS_TIMEOUT_SECONDS,
+                                                        socket_timeout=ANSWER_CACHE_REDIS_TIMEOUT_SECONDS)
+            self.connection.ping()
+        except Exception as error:
+            self.connection = None
+            logger.warn(f"AnswerCache: Redis unavailable, answer cache disabled: {error}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.connection is not None
+
+    def _entries_key(self, namespace: str) -> str:
+        return f"{ANSWER_CACHE_PREFIX}:{namespace}:entries"
+
+    def _vectors_key(self, namespace: str) -> str:
+        return f"{ANSWER_CACHE_PREFIX}:{namespace}:vectors"
+
+    def _stats_key(self) -> str:
+        return f"{ANSWER_CACHE_PREFIX}:stats"
+
+    @log_function_execution
+    def get(self, namespace: str, model: str, embedding: list[float]) -> dict | None:
+        """
+        Looks up the most similar cached answer of a namespace.
+
+        Args:
+            namespace (str): The chat namespace.
+            model (str): The embedding model `embedding` was computed with.
+            embedding (list[float]): The question embedding.
+
+        Returns:
+            dict | None: The cached entry, with its 'similarity', or None on a miss.
+        """
+        if self.connection is None:
+            return None
+
+        try:
+            vectors = self.connection.hgetall(self._vectors_key(namespace))
+            # Entry ids start with the embedding model, so only comparable vectors are stacked
+            prefix = f"{model}:".encode()
+            entry_ids = [entry_id for entry_id in vectors if entry_id.startswith(prefix)]
+            best = None
+            if entry_ids:
+                query = np.array(embedding, dtype=np.float32)
+                query = query / (np.linalg.norm(query) or 1.0)
+                matrix = np.stack([np.frombuffer(vectors[entry_id], dtype=np.float32) for entry_id in entry_ids])
+                similarities = matrix @ query
+                index = int(np.argmax(similarities))
+                if similarities[index] >= ANSWER_CACHE_SIMILARITY_THRESHOLD:
+                    value = self.connection.hget(self._entries_key(namespace), entry_ids[index])
+                    entry = json.loads(value) if value else None
+                    if entry and entry['expires_at'] > time.time():
+                        best = dict(entry, similarity=float(similarities[index]))
+                    else:
+                        self._delete(namespace, [entry_ids[index]])
+        except Exception as error:
+            logger.error(f"AnswerCache.get ERROR: {error}")
+            return None
+
+        self._record(best is not None)
+        return best
+
+    @log_function_execution
+    def set(self, namespace: str, model: str, embedding: list[float], question: str, answer: str, model_name: str) -> None:
+        if self.connection is None:
+            return
+
+        now = time.time()
+        entry = {
+            'question': question,
+            'answer': answer,
+            'model': model,
+            'model_name': model_name,
+            'created_at': now,
+            'expires_at': now + ANSWER_CACHE_TTL_SECONDS,
+        }
+        vector = np.array(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        entry_id = f"{model}:{uuid4()}"
+        try:
+            pipeline = self.connection.pipeline()
+            pipeline.hset(self._entries_key(namespace), entry_id, json.dumps(entry))
+            pipeline.hset(self._vectors_key(namespace), entry_id, vector.tobytes())
+            pipeline.expire(self._entries_key(namespace), ANSWER_CACHE_TTL_SECONDS)
+            pipeline.expire(self._vectors_key(namespace), ANSWER_CACHE_TTL_SECONDS)
+            pipeline.execute()
+            self._evict(namespace)
+        except Exception as error:
+            logger.error(f"AnswerCache.set ERROR: {error}")
+
+    def _delete(self, namespace: str, entry_ids: list) -> None:
+        pipeline = self.connection.pipeline()
+        pipeline.hdel(self._entries_key(namespace), *entry_ids)
+        pipeline.hdel(self._vectors_key(namespace), *entry_ids)
+        pipeline.execute()
+
+    def _evict(self, namespace: str) -> None:
+        key = self._entries_key(namespace)
+        if self.connection.hlen(key) <= ANSWER_CACHE_MAX_ENTRIES_PER_NAMESPACE:
+            return
+        entries = sorted(((json.loads(value)['created_at'], entry_id)
+                          for entry_id, value in self.connection.hgetall(key).items()))
+        excess = len(entries) - ANSWER_CACHE_MAX_ENTRIES_PER_NAMESPACE
+        if excess > 0:
+            self._delete(namespace, [entry_id for _, entry_id in entries[:excess]])
+
+    @log_function_execution
+    def invalidate(self, namespace: str) -> None:
+        """
+        Drops every cached answer of a namespace, e.g. after its vectors changed.
+        """
+        if self.connection is None:
+            return
+        try:
+            self.connection.delete(self._entries_key(namespace), self._vectors_key(namespace))
+        except Exception as error:
+            logger.error(f"AnswerCache.invalidate ERROR: {error}")
+
+    def _record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        try:
+            self.connection.hincrby(self._stats_key(), "hits" if hit else "misses", 1)
+        except Exception as error:
+            logger.error(f"AnswerCache._record ERROR: {error}")
+
+    def get_stats(self) -> dict:
+        """
+        Returns the hit/miss counters of this process and of every process sharing Redis.
+        """
+        stats = {}
+        if self.connection is not None:
+            stats = {key.decode(): int(value) for key, value in self.connection.hgetall(self._stats_key()).items()}
+        hits = stats.get('hits', 0)
+        misses = stats.get('misses', 0)
+        return {
+            'enabled': self.connection is not None,
+            'process_hits': self.hits,
+            'process_misses': self.misses,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        }
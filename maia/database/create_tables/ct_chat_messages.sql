@@ -0,0 +1,12 @@
+CREATE TABLE public.chat_messages (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    chat_id UUID NOT NULL,
+    seq INTEGER NOT NULL,  -- 1, 2, 3... per chat, in write order
+    role TEXT NOT NULL,
+    content TEXT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NULL,
+    CONSTRAINT chat_messages_pkey PRIMARY KEY (id),
+    CONSTRAINT chat_messages_chat_id_seq_key UNIQUE (chat_id, seq),
+    CONSTRAINT chat_messages_chat_id_fkey FOREIGN KEY (chat_id) REFERENCES chats (id)
+) TABLESPACE pg_default;
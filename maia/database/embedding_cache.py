@@ -0,0 +1,226 @@
+# Built-in libraries
+import os
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+# 3rd part libraries
+import numpy as np
+
+# Local libraries
+from maia.src.custom_logging import log_function_execution, logger
+from maia.database.redis import Redis
+
+# Sized in bytes: an ada-002 vector is 1536 float32 values, plus about 300 bytes for its
+# Redis key and LRU entry, so the default 512 MB holds about 80k vectors
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+EMBEDDING_CACHE_ENTRY_BYTES = 1536 * 4 + 300
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES",
+                                            EMBEDDING_CACHE_MAX_BYTES // EMBEDDING_CACHE_ENTRY_BYTES))
+# Every embedding call reads the cache first, so an unreachable Redis must fail fast;
+# long enough for a full embedding batch to be written in one pipeline
+EMBEDDING_CACHE_REDIS_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_CACHE_REDIS_TIMEOUT_SECONDS", 2.0))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(tempfile.gettempdir(), "maia_embedding_cache"))
+EMBEDDING_CACHE_PREFIX = "maia:embedding_cache"
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class RedisEmbeddingStore(object):
+    def __init__(self, connection, max_entries: int) -> None:
+        self.connection = connection
+        self.max_entries = max_entries
+        self.lru_key = f"{EMBEDDING_CACHE_PREFIX}:lru"
+
+    def _vector_key(self, key: str) -> str:
+        return f"{EMBEDDING_CACHE_PREFIX}:vector:{key}"
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        values = self.connection.mget([self._vector_key(key) for key in keys])
+        found = {key: time.time() for key, value in zip(keys, values) if value is not None}
+        if found:
+            self.connection.zadd(self.lru_key, found)
+        return values
+
+    def set_many(self, items: dict[str, bytes]) -> None:
+        now = time.time()
+        pipeline = self.connection.pipeline()
+        for key, value in items.items():
+            pipeline.set(self._vector_key(key), value)
+        pipeline.zadd(self.lru_key, {key: now for key in items})
+        pipeline.execute()
+        self.evict()
+
+    def evict(self) -> None:
+        excess = self.connection.zcard(self.lru_key) - self.max_entries
+        if excess <= 0:
+            return
+        evicted = [key.decode() if isinstance(key, bytes) else key
+                   for key, _ in self.connection.zpopmin(self.lru_key, excess)]
+        if evicted:
+            self.connection.delete(*[self._vector_key(key) for key in evicted])
+
+    def incr_counter(self, name: str, amount: int) -> None:
+        if amount:
+            self.connection.incrby(f"{EMBEDDING_CACHE_PREFIX}:{name}", amount)
+
+    def get_counter(self, name: str) -> int:
+        return int(self.connection.get(f"{EMBEDDING_CACHE_PREFIX}:{name}") or 0)
+
+
+class DiskEmbeddingStore(object):
+    def __init__(self, directory: str, max_entries: int) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(directory, "embeddings.sqlite3"), check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, accessed_at REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed_at ON embeddings (accessed_at)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+        self.connection.commit()
+
+    def get_many(self, keys: list[str]) -> list[bytes | None]:
+        found = {}
+        with self.lock:
+            # Stay below SQLite's bound parameters limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.connection.executemany("UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                                            [(now, key) for key in found])
+                self.connection.commit()
+        return [found.get(key) for key in keys]
+
+    def set_many(self, items: dict[str, bytes]) -> None:
+        now = time.time()
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)",
+                                        [(key, value, now) for key, value in items.items()])
+            self.connection.commit()
+        self.evict()
+
+    def evict(self) -> None:
+        with self.lock:
+            count = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)",
+                    (excess,))
+                self.connection.commit()
+
+    def incr_counter(self, name: str, amount: int) -> None:
+        if not amount:
+            return
+        with self.lock:
+            self.connection.execute("INSERT INTO counters (name, value) VALUES (?, ?) "
+                                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                                    (name, amount))
+            self.connection.commit()
+
+    def get_counter(self, name: str) -> int:
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+
+class EmbeddingCache(object):
+    """
+    Content-addressed embedding cache keyed by a hash of (model, normalized chunk text).
+
+    Vectors live in Redis when it is reachable, otherwise in a local SQLite file.
+    Both stores are bounded to EMBEDDING_CACHE_MAX_ENTRIES and evict least recently used vectors.
+    """
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls(cls._create_store())
+        return cls._instance
+
+    @staticmethod
+    def _create_store():
+        if os.getenv("REDIS_URL"):
+            try:
+                connection = Redis().create_connection(socket_connect_timeout=EMBEDDING_CACHE_REDIS_TIMEOUT_SECONDS,
+                                                       socket_timeout=EMBEDDING_CACHE_REDIS_TIMEOUT_SECONDS)
+                connection.ping()
+                return RedisEmbeddingStore(connection, EMBEDDING_CACHE_MAX_ENTRIES)
+            except Exception as error:
+                logger.warn(f"EmbeddingCache: Redis unavailable, falling back to disk: {error}")
+        return DiskEmbeddingStore(EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES)
+
+    def __init__(self, store) -> None:
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    @log_function_execution
+    def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        """
+        Looks up cached embeddings for texts.
+
+        Returns:
+            list[list[float] | None]: The cached embedding for each text, or None on a miss.
+        """
+        if not texts:
+            return []
+        try:
+            values = self.store.get_many([embedding_cache_key(model, text) for text in texts])
+        except Exception as error:
+            logger.error(f"EmbeddingCache.get_many ERROR: {error}")
+            return [None] * len(texts)
+
+        embeddings = [np.frombuffer(value, dtype=np.float32).tolist() if value is not None else None
+                      for value in values]
+        hits = sum(embedding is not None for embedding in embeddings)
+        self._record(hits, len(texts) - hits)
+        return embeddings
+
+    @log_function_execution
+    def set_many(self, model: str, texts: list[str], embeddings: list[list[float]]) -> None:
+        items = {embedding_cache_key(model, text): np.asarray(embedding, dtype=np.float32).tobytes()
+                 for text, embedding in zip(texts, embeddings) if embedding is not None}
+        if not items:
+            return
+        try:
+            self.store.set_many(items)
+        except Exception as error:
+            logger.error(f"EmbeddingCache.set_many ERROR: {error}")
+
+    def _record(self, hits: int, misses: int) -> None:
+        self.hits += hits
+        self.misses += misses
+        try:
+            self.store.incr_counter("hits", hits)
+            self.store.incr_counter("misses", misses)
+        except Exception as error:
+            logger.error(f"EmbeddingCache._record ERROR: {error}")
+
+    def get_stats(self) -> dict:
+        """
+        Returns the hit/miss counters of this process and of the shared store.
+        """
+        hits = self.store.get_counter("hits")
+        misses = self.store.get_counter("misses")
+        return {
+            'process_hits': self.hits,
+            'process_misses': self.misses,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        }
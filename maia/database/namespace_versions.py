@@ -0,0 +1,71 @@
+# Built-in libraries
+import os
+
+# Local libraries
+from maia.src.custom_logging import logger
+from maia.database.redis import Redis
+
+NAMESPACE_VERSION_PREFIX = "maia:namespace_version"
+# Longer than any per-process cache TTL; an expired version reads as 0, which only forces a rebuild
+NAMESPACE_VERSION_TTL_SECONDS = int(os.getenv("NAMESPACE_VERSION_TTL_SECONDS", 30 * 24 * 3600))
+# Read on every cache lookup, so an unreachable Redis must fail fast
+NAMESPACE_VERSION_REDIS_TIMEOUT_SECONDS = float(os.getenv("NAMESPACE_VERSION_REDIS_TIMEOUT_SECONDS", 0.5))
+
+
+class NamespaceVersions(object):
+    """
+    Version counter per namespace, shared by every process through Redis.
+
+    The version is bumped whenever a namespace's vectors change, e.g. by the files
+    worker after an ingestion. Per-process caches key their entries by the version
+    they were built at, so a change made in another process is seen on the next
+    lookup. When Redis is unavailable every version reads as 0 and those caches
+    fall back to their TTL.
+    """
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self) -> None:
+        self.connection = None
+        try:
+            self.connection = Redis().create_connection(socket_connect_timeout=NAMESPACE_VERSION_REDIS_TIMEOUT_SECONDS,
+                                                        socket_timeout=NAMESPACE_VERSION_REDIS_TIMEOUT_SECONDS)
+            self.connection.ping()
+        except Exception as error:
+            self.connection = None
+            logger.warn(f"NamespaceVersions: Redis unavailable, caches expire by TTL only: {error}")
+
+    def _key(self, namespace: str) -> str:
+        return f"{NAMESPACE_VERSION_PREFIX}:{namespace}"
+
+    def get(self, namespace: str) -> int:
+        if self.connection is None:
+            return 0
+        try:
+            return int(self.connection.get(self._key(namespace)) or 0)
+        except Exception as error:
+            logger.error(f"NamespaceVersions: {namespace}: failed to read version ERROR: {error}")
+            return 0
+
+    def bump(self, namespace: str) -> int:
+        """
+        Marks every process' cached state of `namespace` as stale.
+
+        Returns:
+            int: The new version, 0 when Redis is unavailable.
+        """
+        if self.connection is None:
+            return 0
+        try:
+            pipeline = self.connection.pipeline()
+            pipeline.incr(self._key(namespace))
+            pipeline.expire(self._key(namespace), NAMESPACE_VERSION_TTL_SECONDS)
+            return int(pipeline.execute()[0])
+        except Exception as error:
+            logger.error(f"NamespaceVersions: {namespace}: failed to bump version ERROR: {error}")
+            return 0
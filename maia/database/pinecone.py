@@ -3,6 +3,7 @@ import os
 
 class PineconeClient:
     _instance = None
+    _indexes = {}
 
     @classmethod
     def get_instance(cls):
@@ -12,3 +13,12 @@ class PineconeClient:
                           environment=os.getenv("PINECONE_ENV"))
             cls._instance = pinecone.Index(os.getenv("PINECONE_INDEX"))
         return cls._instance
+
+    @classmethod
+    def get_index(cls, index_name: str = None):
+        if not index_name or index_name == os.getenv("PINECONE_INDEX"):
+            return cls.get_instance()
+        if index_name not in cls._indexes:
+            cls.get_instance()
+            cls._indexes[index_name] = pinecone.Index(index_name)
+        return cls._indexes[index_name]
@@ -1,12 +1,18 @@
 import os
 import redis
+import redis.asyncio
 
 class Redis():
     def __init__(self):
         """initialize  connection """
         self.connection_url = os.getenv("REDIS_URL")
 
-    def create_connection(self):
-        self.connection = redis.from_url(self.connection_url, db=0)
+    def create_connection(self, **kwargs):
+        # kwargs are passed to redis, e.g. socket_connect_timeout and socket_timeout
+        self.connection = redis.from_url(self.connection_url, db=0, **kwargs)
 
-        return self.connection
\ No newline at end of file
+        return self.connection
+
+    def create_async_connection(self, **kwargs):
+        # Bound to the event loop it is first used in
+        return redis.asyncio.from_url(self.connection_url, db=0, **kwargs)
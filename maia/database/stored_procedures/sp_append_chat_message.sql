@@ -0,0 +1,35 @@
+-- DROP function append_chat_message(UUID, TEXT, TEXT)
+CREATE OR REPLACE FUNCTION append_chat_message(p_chat_id UUID, p_role TEXT, p_content TEXT)
+RETURNS JSON LANGUAGE plpgsql AS $$
+DECLARE
+    v_seq INTEGER;
+    v_message chat_messages;
+BEGIN
+    -- Take the chat's next seq; the row lock orders concurrent appends to the same chat only
+    UPDATE chats
+    SET
+        last_message_seq = last_message_seq + 1,
+        updated_at = NOW()
+    WHERE id = p_chat_id
+    RETURNING last_message_seq INTO v_seq;
+
+    -- Chat ID does not exist
+    IF v_seq IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO chat_messages (chat_id, seq, role, content)
+    VALUES (p_chat_id, v_seq, p_role, p_content)
+    RETURNING * INTO v_message;
+
+    -- Return the message shaped like the former chats.messages items
+    RETURN json_build_object(
+        'id', v_message.id,
+        '_id', v_message.seq::TEXT,
+        'seq', v_message.seq,
+        'role', v_message.role,
+        'content', v_message.content,
+        'created_at', v_message.created_at
+    );
+END;
+$$;
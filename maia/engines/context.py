@@ -0,0 +1,147 @@
+# Built-in libraries
+import os
+from collections import Counter
+
+# 3rd part libraries
+import numpy as np
+from langchain.schema import Document
+from langchain.vectorstores.utils import maximal_marginal_relevance
+
+# Local libraries
+from maia.src.custom_logging import log_function_execution, logger
+from maia.src.rate_limiter import PRIORITY_INTERACTIVE
+from maia.engines.embeddings import count_tokens, EmbeddingBackend
+
+# "on" retrieves CONTEXT_FETCH_K candidates and compacts them, "off" stuffs the plain top-k
+CONTEXT_COMPACTION = os.getenv("CONTEXT_COMPACTION", "on")
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", 12))
+# Caps the stuffed context; when unset, the query engine fills what the 4K model has room for
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET")) if os.getenv("CONTEXT_TOKEN_BUDGET") else None
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7))
+# Chunks at least this similar to an already selected one are dropped as near-duplicates
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", 0.95))
+# A short line found in this many candidate chunks is a page header/footer, kept only once
+CONTEXT_BOILERPLATE_MIN_CHUNKS = 3
+CONTEXT_BOILERPLATE_MAX_LINE_LENGTH = 120
+
+
+def normalize_line(line: str) -> str:
+    return " ".join(line.lower().split())
+
+
+def normalize_vector(vector) -> np.ndarray:
+    vector = np.array(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def strip_boilerplate(texts: list[str]) -> list[str]:
+    """
+    Removes lines repeated across many chunks (page headers and footers), keeping
+    their first occurrence.
+    """
+    chunk_counts = Counter()
+    for text in texts:
+        chunk_counts.update({normalize_line(line) for line in text.splitlines()
+                             if line.strip() and len(line) <= CONTEXT_BOILERPLATE_MAX_LINE_LENGTH})
+    boilerplate = {line for line, count in chunk_counts.items() if count >= CONTEXT_BOILERPLATE_MIN_CHUNKS}
+    if not boilerplate:
+        return texts
+
+    seen = set()
+    stripped = []
+    for text in texts:
+        lines = []
+        for line in text.splitlines():
+            normalized = normalize_line(line)
+            if normalized in boilerplate:
+                if normalized in seen:
+                    continue
+                seen.add(normalized)
+            lines.append(line)
+        stripped.append("\n".join(lines))
+    return stripped
+
+
+@log_function_execution
+def compact_context(query: str, docs: list[Document], embedding_backend: EmbeddingBackend,
+                    token_budget: int | None = CONTEXT_TOKEN_BUDGET, embeddings: list | None = None,
+                    query_embedding: list[float] | None = None) -> tuple[list[Document], dict]:
+    """
+    Turns the retrieved candidates into the context to stuff into the prompt.
+
+    1. Drops exact duplicates and repeated header/footer lines
+    2. Orders the chunks by maximal marginal relevance, skipping near-duplicates
+    3. Keeps chunks in that order while they fit in `token_budget` tokens
+
+    The vectors retrieval returned with the chunks are reused; only when they
+    are missing are the chunks embedded again, as interactive requests.
+
+    Args:
+        query (str): The user question.
+        docs (list[Document]): The retrieved candidates, best match first.
+        embedding_backend (EmbeddingBackend): The backend the namespace was embedded with.
+        token_budget (int | None): The maximum context tokens, None for no limit.
+        embeddings (list | None): The vector of each candidate, as stored in the index.
+        query_embedding (list[float] | None): The question embedding used for retrieval.
+
+    Returns:
+        tuple: The compacted documents and the compaction metadata.
+    """
+    unique_docs = []
+    unique_embeddings = []
+    seen_texts = set()
+    for i, doc in enumerate(docs):
+        normalized = normalize_line(doc.page_content)
+        if normalized and normalized not in seen_texts:
+            seen_texts.add(normalized)
+            unique_docs.append(doc)
+            unique_embeddings.append(embeddings[i] if embeddings is not None else None)
+
+    order = list(range(len(unique_docs)))
+    embeddings = None
+    if len(unique_docs) > 1:
+        try:
+            embeddings = unique_embeddings
+            if any(embedding is None for embedding in embeddings):
+                embeddings = embedding_backend.embed_documents([doc.page_content for doc in unique_docs],
+                                                               priority=PRIORITY_INTERACTIVE)
+            if query_embedding is None:
+                query_embedding = embedding_backend.embed_query(query)
+            if all(embedding is not None for embedding in embeddings):
+                # New arrays: stored vectors may be read-only views of a memory-mapped index
+                embeddings = [normalize_vector(embedding) for embedding in embeddings]
+                order = maximal_marginal_relevance(normalize_vector(query_embedding), embeddings,
+                                                   lambda_mult=CONTEXT_MMR_LAMBDA, k=len(unique_docs))
+            else:
+                embeddings = None
+        except Exception as error:
+            logger.error(f"compact_context: failed to embed candidates, keeping retrieval order ERROR: {error}")
+            embeddings = None
+
+    texts = strip_boilerplate([unique_docs[i].page_content for i in order])
+
+    selected = []
+    selected_vectors = []
+    used_tokens = 0
+    near_duplicates = 0
+    for i, text in zip(order, texts):
+        if embeddings is not None:
+            vector = embeddings[i]
+            if any(float(vector @ other) >= CONTEXT_DUPLICATE_SIMILARITY for other in selected_vectors):
+                near_duplicates += 1
+                continue
+        tokens = count_tokens(text)
+        # The best chunk is always kept, route_model trims it if it does not fit
+        if token_budget is not None and used_tokens + tokens > token_budget and selected:
+            continue
+        used_tokens += tokens
+        selected.append(Document(page_content=text, metadata=unique_docs[i].metadata))
+        if embeddings is not None:
+            selected_vectors.append(vector)
+
+    compaction = {
+        'retrieved_chunks': len(docs),
+        'duplicate_chunks': len(docs) - len(unique_docs) + near_duplicates,
+        'context_tokens': used_tokens,
+    }
+    return selected, compaction
@@ -1,18 +1,25 @@
 # Built-in libraries
 import os
+import tempfile
 import concurrent.futures
 from uuid import uuid4
 from datetime import datetime
 
 # 3rd part libraries
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 # Local libraries
 from maia.src.message import Message
-from maia.engines.query import query
+from maia.engines.query import invalidate_namespace_caches
+from maia.engines.summarize import enqueue_summary
+from maia.engines.embeddings import get_embedding_backend, get_file_embedding_backend
+from maia.engines.parse import iter_pdf_documents, PARSE_MODE
+from maia.engines.pipeline import Pipeline, batched
+from maia.engines.upsert import ConcurrentUpserter, upsert_vectors
+from maia.engines.restore import restore_namespace
 from maia.src.utils import Utils
+from maia.src.vector_archive import VectorArchiveWriter, dump_vectors
 from maia.src.custom_logging import log_function_execution, logger
 from maia.database.supabase import SupabaseClient
 from maia.database.pinecone import PineconeClient
@@ -21,19 +28,38 @@ from maia.database.s3 import S3Client
 supabase_client = SupabaseClient.get_instance()
 pinecone_client = PineconeClient.get_instance()
 s3_client = S3Client.get_instance()
-openai_embeddings = OpenAIEmbeddings()
+embedding_backend = get_embedding_backend()
 
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 0
+EMBEDDING_MODE = os.getenv("EMBEDDING_MODE", "batch")
+INGESTION_MODE = os.getenv("INGESTION_MODE", "streaming")
+PIPELINE_EMBED_BATCH_SIZE = 256
 AWS_S3_RAW_FILES_BUCKET = os.getenv("AWS_S3_RAW_FILE_BUCKET")
 
+def build_vector(document, document_id: str, embedding: list[float]) -> dict:
+    metadata = {}
+    metadata['source'] = document.metadata['source']
+    metadata['text'] = document.page_content
+    metadata['page_number'] = document.metadata['page']
+    vector = {
+        "id": document_id,
+        "values": embedding,
+        "metadata": metadata
+    }
+    return vector
+
 @log_function_execution
 def embedd_docs_from_raw_file(file_name: str) -> list[dict]:
-    # Load PDF Data
-    loader = PyPDFLoader(file_name, extract_images=True)
-    
-    # Create Documents
-    documents = loader.load_and_split()
+    if PARSE_MODE == "parallel":
+        # Parse page-range shards on a process pool
+        documents = list(iter_pdf_documents(file_name, extract_images=True))
+    else:
+        # Load PDF Data
+        loader = PyPDFLoader(file_name, extract_images=True)
+        
+        # Create Documents
+        documents = loader.load_and_split()
     
     # Split Documents
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
@@ -43,21 +69,22 @@ def embedd_docs_from_raw_file(file_name: str) -> list[dict]:
     embedded_docs = []
     ids = [str(uuid4()) for _ in splitted_documents]
 
+    if EMBEDDING_MODE == "batch":
+        embeddings = embedding_backend.embed_documents([document.page_content for document in splitted_documents])
+        for i, document in enumerate(splitted_documents):
+            if embeddings[i] is not None:
+                embedded_docs.append(build_vector(document, ids[i], embeddings[i]))
+        return embedded_docs
+
     def process_document(document, document_id):
-        embedding = openai_embeddings.embed_query(document.page_content)
-        metadata = {}
-        metadata['source'] = document.metadata['source']
-        metadata['text'] = document.page_content
-        metadata['page_number'] = document.metadata['page']
-        vector = {
-            "id": document_id,
-            "values": embedding,
-            "metadata": metadata
-        }
-        return vector
+        # Same backend, model and bulk rate limit as the batch mode, one input per request
+        embedding = embedding_backend.embed_documents([document.page_content])[0]
+        if embedding is None:
+            raise RuntimeError(f"failed to embed document {document_id}")
+        return build_vector(document, document_id, embedding)
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=35) as executor:
-        futures = [executor.submit(process_document, document, ids[i]) for i, document in enumerate(documents)]
+        futures = [executor.submit(process_document, document, ids[i]) for i, document in enumerate(splitted_documents)]
 
         for future in concurrent.futures.as_completed(futures):
             try:
@@ -74,7 +101,53 @@ def load_embeddings_to_vetorial_db(user_id: str, file_id: str, embedded_docs: li
     namespace = f"{user_id}.{file_id}"
     
     # Upload vectors to Pinecone
-    pinecone_client.upsert(vectors=embedded_docs, namespace=namespace, batch_size=32)
+    upsert_vectors(embedded_docs, namespace, index=PineconeClient.get_index(embedding_backend.index_name))
+
+@log_function_execution
+def stream_embeddings_to_vetorial_db(user_id: str, file_id: str, file_name: str, archive_path: str) -> int:
+    """
+    Parses, splits, embeds and upserts a PDF as a staged pipeline.
+
+    Pages flow through bounded queues between stages, so vectors become searchable
+    while later pages are still being parsed, and only a few batches are ever in memory.
+    Upserted vectors are appended to a binary vectors archive at `archive_path`.
+
+    Returns:
+        int: The number of vectors upserted.
+    """
+    namespace = f"{user_id}.{file_id}"
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    vectors_count = 0
+
+    def split_stage(pages):
+        for page in pages:
+            yield from text_splitter.split_documents([page])
+
+    def embed_stage(chunks):
+        for batch in batched(chunks, PIPELINE_EMBED_BATCH_SIZE):
+            embeddings = embedding_backend.embed_documents([chunk.page_content for chunk in batch])
+            yield [build_vector(chunk, str(uuid4()), embedding)
+                   for chunk, embedding in zip(batch, embeddings) if embedding is not None]
+
+    with open(archive_path, 'wb') as archive_file, \
+         VectorArchiveWriter(archive_file) as archive_writer, \
+         ConcurrentUpserter(namespace, index=PineconeClient.get_index(embedding_backend.index_name)) as upserter:
+
+        def upsert_stage(vector_batches):
+            nonlocal vectors_count
+            for vectors in vector_batches:
+                upserter.add(vectors)
+                archive_writer.write(vectors)
+                vectors_count += len(vectors)
+                yield len(vectors)
+
+        Pipeline("ingestion") \
+            .add_stage("split", split_stage) \
+            .add_stage("embed", embed_stage) \
+            .add_stage("upsert", upsert_stage) \
+            .run(iter_pdf_documents(file_name, extract_images=True))
+
+    return vectors_count
 
 @log_function_execution
 def update_file_status_to(file_id: str, status: str, extra: dict = None) -> None:
@@ -93,15 +166,81 @@ def update_file_status_to(file_id: str, status: str, extra: dict = None) -> None
     supabase_client.table('files').update(to_update).eq('id', file_id).execute()
 
 @log_function_execution
-def embed(user_id: str, file: dict, tmp_raw_file_path: str = None) -> None:
+def find_ready_file_by_content_hash(content_hash: str, exclude_file_id: str) -> dict | None:
+    """
+    Finds an already processed file with the same content, from any user.
+
+    Returns:
+        dict: The most recent ready file with this content hash.
+        None: When the content was never processed.
+    """
+    response = supabase_client.table('files') \
+                              .select('id, chat_id, s3_raw_file_key, s3_vectors_key, summary, chunk_size, chunk_overlap, '
+                                      'embedding_backend, embedding_model, embedding_dimension, vector_count') \
+                              .eq('content_hash', content_hash) \
+                              .eq('status', 'Pronto') \
+                              .eq('is_deleted', False) \
+                              .neq('id', exclude_file_id) \
+                              .order('created_at', desc=True) \
+                              .limit(1) \
+                              .execute()
+    if response.data:
+        return response.data[0]
+    return None
+
+@log_function_execution
+def clone_embedded_file(user_id: str, file: dict, source_file: dict, content_hash: str) -> bool:
+    """
+    Reuses a processed file for `file`: vectors are restored from the source S3 archive
+    into the new chat namespace and the stored summary is written to the new chat,
+    skipping parsing, OCR, transcription and embedding.
+
+    Returns:
+        bool: True if the file was cloned, False if it must be processed from scratch.
+    """
+    namespace = f"{user_id}.{file['chat_id']}"
+    source_backend = get_file_embedding_backend(source_file)
+    try:
+        restore_namespace(source_file['s3_vectors_key'], namespace, source_backend.index_name)
+        Utils().copy_s3_file(source_file['s3_vectors_key'], file['s3_vectors_key'])
+        Utils().copy_s3_file(source_file['s3_raw_file_key'], file['s3_raw_file_key'])
+    except Exception as e:
+        logger.error(f"clone_embedded_file: Error cloning file {source_file['id']} into {file['id']}: {e}")
+        PineconeClient.get_index(source_backend.index_name).delete(delete_all=True, namespace=namespace)
+        return False
+
+    update_file_status_to(file['id'], 'Pronto', {
+        'chunk_size': source_file['chunk_size'],
+        'chunk_overlap': source_file['chunk_overlap'],
+        'content_hash': content_hash,
+        'summary': source_file.get('summary'),
+        'deduplicated_from': source_file['id'],
+        'vector_count': source_file.get('vector_count'),
+        **source_backend.describe()
+    })
+
+    # The source summary may still be in its queue, then the copy gets its own
+    if source_file.get('summary'):
+        Message().write_to_chat(source_file['summary'], "assistant", file['chat_id'])
+    else:
+        enqueue_summary(user_id, file)
+
+    logger.info(f"EmbeddingMotor reused file {source_file['id']} for user {user_id} on file {file['id']}")
+    return True
+
+@log_function_execution
+def embed(user_id: str, file: dict, tmp_raw_file_path: str = None, content_hash: str = None) -> None:
     """
     1. Download source file or get from local file path
-    2. Create embeddings from file
-    3. Upload embeddings to vetorial DB
-    4. Move raw embeddings/source file to AWS S3
-    5. Delete local raw embeddings/source file
+    2. Reuse an identical, already processed file when there is one
+    3. Create embeddings from file
+    4. Upload embeddings to vetorial DB
+    5. Move raw embeddings/source file to AWS S3
+    6. Delete local raw embeddings/source file
+    7. Mark the file ready and queue its startup summary
     """
     logger.info(f"EmbeddingMotor instanciated for user {user_id} on file {file['id']}")
+    vectors_archive_path = None
     
     try:
         if not tmp_raw_file_path:
@@ -114,31 +253,24 @@ def embed(user_id: str, file: dict, tmp_raw_file_path: str = None) -> None:
         # Update file status
         update_file_status_to(file['id'], 'Processando')
         
-        # Create embedded docs
-        embedded_docs = embedd_docs_from_raw_file(tmp_raw_file_path)
-        
-        # Load embedded docs to vetorial db
-        load_embeddings_to_vetorial_db(user_id, file['chat_id'], embedded_docs)
-        
-        # Update file status
-        extra_data_to_update = {
-            'chunk_size': CHUNK_SIZE,
-            'chunk_overlap': CHUNK_OVERLAP
-        }
+        # Deduplicate by content
+        content_hash = content_hash or Utils().hash_file(tmp_raw_file_path)
+        source_file = find_ready_file_by_content_hash(content_hash, file['id'])
+        if source_file and clone_embedded_file(user_id, file, source_file, content_hash):
+            Utils().delete_local_file(tmp_raw_file_path)
+            return
         
-        # Write startup message
-        namespace = f"{user_id}.{file['chat_id']}"
-        startup_question = "Resuma o documento e sugira de em formato de lista 3 perguntas que poderiam ser feitas a esse documento."
-        llm_response = query(namespace, startup_question)
-        if llm_response['error']:
-            Message().save_message_metadata(user_id, file['chat_id'], startup_question, llm_response, "system", "error")
-            logger.error("Failed to write startup message, error: ")
+        if INGESTION_MODE == "streaming":
+            # Parse, embed and upsert concurrently, archiving vectors to a local file
+            vectors_archive_path = tempfile.NamedTemporaryFile(delete=False, suffix=".maiavec").name
+            vector_count = stream_embeddings_to_vetorial_db(user_id, file['chat_id'], tmp_raw_file_path, vectors_archive_path)
         else:
-            Message().write_to_chat(llm_response['output_message'], "assistant", file['chat_id'])
-            Message().save_message_metadata(user_id, file['chat_id'], startup_question, llm_response)
-
-
-        update_file_status_to(file['id'], 'Pronto', extra_data_to_update)
+            # Create embedded docs
+            embedded_docs = embedd_docs_from_raw_file(tmp_raw_file_path)
+            
+            # Load embedded docs to vetorial db
+            load_embeddings_to_vetorial_db(user_id, file['chat_id'], embedded_docs)
+            vector_count = len(embedded_docs)
         
         # Compress raw file
         # compressed_file_path = file['name'] + ".gz"
@@ -153,14 +285,38 @@ def embed(user_id: str, file: dict, tmp_raw_file_path: str = None) -> None:
         # Deletes temp file
         # Utils().delete_local_file(compressed_file_path)
         
-        # Compress embedded_docs
-        bytes_compressed_embedded_docs = Utils().compress_dict(embedded_docs)
-        
-        # Moves compressed embedded docs to s3
-        Utils().move_bytes_to_s3(bytes_compressed_embedded_docs, file['s3_vectors_key'])
+        if INGESTION_MODE == "streaming":
+            # Moves vectors archive to s3, the local copy is deleted below
+            Utils().move_file_to_s3(vectors_archive_path, file['s3_vectors_key'])
+        else:
+            # Serialize embedded_docs as a vectors archive
+            bytes_vectors_archive = dump_vectors(embedded_docs)
+            
+            # Moves vectors archive to s3
+            Utils().move_bytes_to_s3(bytes_vectors_archive, file['s3_vectors_key'])
         
-        logger.info(f"EmbeddingMotor finished for user {user_id} on file {file['id']}")
+        # Update file status, the file can be queried from now on
+        extra_data_to_update = {
+            'chunk_size': CHUNK_SIZE,
+            'chunk_overlap': CHUNK_OVERLAP,
+            'content_hash': content_hash,
+            'vector_count': vector_count,
+            **embedding_backend.describe()
+        }
+        update_file_status_to(file['id'], 'Pronto', extra_data_to_update)
+        invalidate_namespace_caches(f"{user_id}.{file['chat_id']}")
     except Exception as e:
         logger.error(f"engine.embed: Error trying to embed for user {user_id} on file {file['id']}: {e}")
         update_file_status_to(file['id'], 'Erro')
+        return
+    finally:
+        # The archive is as large as the file's vectors, never leave it behind
+        if vectors_archive_path:
+            Utils().delete_local_file(vectors_archive_path)
+    
+    # Startup message is summarized from the vectors archive by its own job, out of
+    # the ingestion try: a summary failure must not flip a ready file to 'Erro'
+    enqueue_summary(user_id, file)
+    
+    logger.info(f"EmbeddingMotor finished for user {user_id} on file {file['id']}")
         
\ No newline at end of file
@@ -0,0 +1,336 @@
+# Built-in libraries
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+import concurrent.futures
+
+# 3rd part libraries
+import openai
+import tiktoken
+from langchain.embeddings.base import Embeddings
+
+# Local libraries
+from maia.src.custom_logging import log_function_execution, logger
+from maia.src.rate_limiter import RateLimiter, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from maia.src.blocking_executor import run_blocking
+from maia.database.embedding_cache import EmbeddingCache
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_DIMENSION = 1536
+EMBEDDING_ENCODING = "cl100k_base"
+
+# Local CPU sentence-embedding model, see LocalEmbeddingBackend
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+LOCAL_EMBEDDING_DIMENSION = int(os.getenv("LOCAL_EMBEDDING_DIMENSION", 384))
+LOCAL_EMBEDDING_WORKERS = int(os.getenv("LOCAL_EMBEDDING_WORKERS", os.cpu_count() or 1))
+LOCAL_EMBEDDING_BATCH_SIZE = 64
+
+# OpenAI per-request limits
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+EMBEDDING_BATCH_MAX_INPUTS = 2048
+EMBEDDING_BATCH_MAX_TOKENS = 100000
+
+EMBEDDING_BATCH_WORKERS = 4
+EMBEDDING_BATCH_MAX_RETRIES = 5
+
+RETRYABLE_OPENAI_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+)
+
+encoding = tiktoken.get_encoding(EMBEDDING_ENCODING)
+
+
+def count_tokens(text: str) -> int:
+    return len(encoding.encode(text))
+
+
+def truncate_to_max_tokens(text: str, max_tokens: int = EMBEDDING_MAX_INPUT_TOKENS) -> str:
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def build_token_batches(texts: list[str],
+                        max_inputs: int = EMBEDDING_BATCH_MAX_INPUTS,
+                        max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS) -> list[list[int]]:
+    """
+    Packs texts into batches that respect the per-request input and token caps.
+
+    Args:
+        texts (list[str]): The texts to be embedded.
+        max_inputs (int): Maximum number of inputs per request.
+        max_tokens (int): Maximum number of tokens per request.
+
+    Returns:
+        list[list[int]]: Batches of indexes into `texts`, in their original order.
+    """
+    batches = []
+    current_batch = []
+    current_tokens = 0
+    for index, text in enumerate(texts):
+        text_tokens = min(count_tokens(text), EMBEDDING_MAX_INPUT_TOKENS)
+        if current_batch and (len(current_batch) >= max_inputs or current_tokens + text_tokens > max_tokens):
+            batches.append(current_batch)
+            current_batch = []
+            current_tokens = 0
+        current_batch.append(index)
+        current_tokens += text_tokens
+
+    if current_batch:
+        batches.append(current_batch)
+
+    return batches
+
+
+def embed_batch(texts: list[str], model: str = EMBEDDING_MODEL, priority: str = PRIORITY_BULK) -> list[list[float]]:
+    """
+    Embeds a single batch with one OpenAI request, retrying only this batch on transient errors.
+    """
+    inputs = [truncate_to_max_tokens(text) for text in texts]
+    tokens = sum(count_tokens(text) for text in inputs)
+    for attempt in range(EMBEDDING_BATCH_MAX_RETRIES):
+        try:
+            RateLimiter.get_instance().acquire('embeddings', tokens, priority)
+            response = openai.Embedding.create(input=inputs, model=model)
+            data = sorted(response['data'], key=lambda item: item['index'])
+            return [item['embedding'] for item in data]
+        except RETRYABLE_OPENAI_ERRORS as error:
+            if attempt == EMBEDDING_BATCH_MAX_RETRIES - 1:
+                raise
+            wait_seconds = 2 ** attempt
+            logger.warn(f"embed_batch: {error}. Retry {attempt + 1} of {EMBEDDING_BATCH_MAX_RETRIES} in {wait_seconds}s")
+            time.sleep(wait_seconds)
+
+
+async def aembed_batch(texts: list[str], model: str = EMBEDDING_MODEL,
+                       priority: str = PRIORITY_BULK) -> list[list[float]]:
+    """
+    Async `embed_batch`, on OpenAI's async client.
+    """
+    inputs = [truncate_to_max_tokens(text) for text in texts]
+    tokens = sum(count_tokens(text) for text in inputs)
+    for attempt in range(EMBEDDING_BATCH_MAX_RETRIES):
+        try:
+            await RateLimiter.get_instance().aacquire('embeddings', tokens, priority)
+            response = await openai.Embedding.acreate(input=inputs, model=model)
+            data = sorted(response['data'], key=lambda item: item['index'])
+            return [item['embedding'] for item in data]
+        except RETRYABLE_OPENAI_ERRORS as error:
+            if attempt == EMBEDDING_BATCH_MAX_RETRIES - 1:
+                raise
+            wait_seconds = 2 ** attempt
+            logger.warn(f"aembed_batch: {error}. Retry {attempt + 1} of {EMBEDDING_BATCH_MAX_RETRIES} in {wait_seconds}s")
+            await asyncio.sleep(wait_seconds)
+
+
+@log_function_execution
+def embed_texts_in_batches(texts: list[str],
+                           model: str = EMBEDDING_MODEL,
+                           use_cache: bool = True,
+                           priority: str = PRIORITY_BULK) -> list[list[float] | None]:
+    """
+    Embeds texts using multi-input requests sized by tiktoken token counts.
+
+    Cached vectors are reused before any OpenAI request is made, and freshly
+    computed vectors are written back to the cache.
+
+    Args:
+        texts (list[str]): The texts to be embedded.
+        model (str): The OpenAI embedding model.
+        use_cache (bool): Whether to read from and write to the embedding cache.
+        priority (str): Rate limiter priority of the requests.
+
+    Returns:
+        list[list[float] | None]: One embedding per text, in the same order as `texts`.
+            Texts whose batch failed after all retries are returned as None.
+    """
+    embedding_cache = EmbeddingCache.get_instance() if use_cache else None
+    embeddings = embedding_cache.get_many(model, texts) if use_cache else [None] * len(texts)
+
+    # Only embed what the cache could not answer
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    batches = [[missing[i] for i in batch] for batch in build_token_batches([texts[i] for i in missing])]
+    logger.info(f"embed_texts_in_batches: {len(texts) - len(missing)} cached, "
+                f"{len(missing)} texts packed into {len(batches)} requests")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=EMBEDDING_BATCH_WORKERS) as executor:
+        futures = {executor.submit(embed_batch, [texts[i] for i in batch], model, priority): batch for batch in batches}
+
+        for future in concurrent.futures.as_completed(futures):
+            batch = futures[future]
+            try:
+                batch_embeddings = future.result()
+            except Exception as e:
+                logger.error(f"embed_texts_in_batches: Error embedding batch of {len(batch)} texts: {e}")
+                continue
+
+            for index, embedding in zip(batch, batch_embeddings):
+                embeddings[index] = embedding
+            if use_cache:
+                embedding_cache.set_many(model, [texts[i] for i in batch], batch_embeddings)
+
+    return embeddings
+
+
+class EmbeddingBackend(Embeddings):
+    """
+    An embedding model together with the Pinecone index that stores its vectors.
+
+    `embed_documents` returns None for texts that could not be embedded, so
+    ingestion can skip them; `embed_query` always returns a vector or raises.
+    """
+    name: str = None
+    model: str = None
+    dimension: int = None
+    index_name: str = None
+
+    def describe(self) -> dict:
+        # Stored on every file so queries use the backend its vectors came from
+        return {
+            'embedding_backend': self.name,
+            'embedding_model': self.model,
+            'embedding_dimension': self.dimension
+        }
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    name = "openai"
+    model = EMBEDDING_MODEL
+    dimension = EMBEDDING_DIMENSION
+    index_name = os.getenv("PINECONE_INDEX")
+
+    def embed_documents(self, texts: list[str], priority: str = PRIORITY_BULK) -> list[list[float] | None]:
+        return embed_texts_in_batches(texts, self.model, priority=priority)
+
+    def embed_query(self, text: str) -> list[float]:
+        embedding = embed_texts_in_batches([text], self.model, priority=PRIORITY_INTERACTIVE)[0]
+        if embedding is None:
+            raise RuntimeError("OpenAIEmbeddingBackend: failed to embed query")
+        return embedding
+
+    async def aembed_query(self, text: str) -> list[float]:
+        embedding = (await run_blocking(lambda: EmbeddingCache.get_instance().get_many(self.model, [text])))[0]
+        if embedding is None:
+            embedding = (await aembed_batch([text], self.model, PRIORITY_INTERACTIVE))[0]
+            await run_blocking(lambda: EmbeddingCache.get_instance().set_many(self.model, [text], [embedding]))
+        return embedding
+
+
+_local_model = None
+
+
+def _load_local_model(model_name: str) -> None:
+    # Runs once in every worker process of LocalEmbeddingBackend
+    global _local_model
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        raise ImportError("`sentence-transformers` package not found, please install it with "
+                          "`pip install sentence-transformers` to use EMBEDDING_BACKEND=local")
+    _local_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_with_local_model(texts: list[str]) -> list[list[float]]:
+    return _local_model.encode(texts, batch_size=len(texts), normalize_embeddings=True).tolist()
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    Sentence-embedding model running on CPU in a pool of worker processes.
+
+    Its vectors have a different dimension than OpenAI's, so they live in their
+    own Pinecone index (PINECONE_LOCAL_INDEX).
+    """
+    name = "local"
+    index_name = os.getenv("PINECONE_LOCAL_INDEX")
+
+    def __init__(self, model: str = LOCAL_EMBEDDING_MODEL,
+                 dimension: int = LOCAL_EMBEDDING_DIMENSION,
+                 workers: int = LOCAL_EMBEDDING_WORKERS) -> None:
+        self.model = model
+        self.dimension = dimension
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_load_local_model,
+                    initargs=(self.model,))
+            return self.executor
+
+    @log_function_execution
+    def embed_documents(self, texts: list[str], priority: str = PRIORITY_BULK) -> list[list[float] | None]:
+        # Runs locally, so `priority` has no rate limit budget to pick from
+        embedding_cache = EmbeddingCache.get_instance()
+        embeddings = embedding_cache.get_many(self.model, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        batches = [missing[start:start + LOCAL_EMBEDDING_BATCH_SIZE]
+                   for start in range(0, len(missing), LOCAL_EMBEDDING_BATCH_SIZE)]
+        executor = self._get_executor()
+        futures = [executor.submit(_encode_with_local_model, [texts[i] for i in batch]) for batch in batches]
+        for batch, future in zip(batches, futures):
+            try:
+                batch_embeddings = future.result()
+            except Exception as e:
+                logger.error(f"LocalEmbeddingBackend: Error embedding batch of {len(batch)} texts: {e}")
+                continue
+            for index, embedding in zip(batch, batch_embeddings):
+                embeddings[index] = embedding
+            embedding_cache.set_many(self.model, [texts[i] for i in batch], batch_embeddings)
+
+        return embeddings
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._get_executor().submit(_encode_with_local_model, [text]).result()[0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await asyncio.wrap_future(self._get_executor().submit(_encode_with_local_model, [text])))[0]
+
+
+EMBEDDING_BACKENDS = {
+    OpenAIEmbeddingBackend.name: OpenAIEmbeddingBackend,
+    LocalEmbeddingBackend.name: LocalEmbeddingBackend,
+}
+
+_embedding_backends = {}
+_embedding_backends_lock = threading.Lock()
+
+
+def get_embedding_backend(name: str = None, model: str = None) -> EmbeddingBackend:
+    """
+    Returns a shared backend instance.
+
+    Args:
+        name (str): "openai" or "local". Defaults to the deployment's EMBEDDING_BACKEND.
+        model (str): The model recorded for a file. Defaults to the backend's model.
+    """
+    name = name or EMBEDDING_BACKEND
+    with _embedding_backends_lock:
+        if (name, model) not in _embedding_backends:
+            backend_class = EMBEDDING_BACKENDS[name]
+            backend = backend_class(model=model) if model and backend_class is LocalEmbeddingBackend else backend_class()
+            _embedding_backends[(name, model)] = backend
+        return _embedding_backends[(name, model)]
+
+
+def get_file_embedding_backend(file: dict) -> EmbeddingBackend:
+    """
+    Returns the backend a file was embedded with. Files recorded before backends
+    were selectable were embedded with OpenAI.
+    """
+    return get_embedding_backend(file.get('embedding_backend') or OpenAIEmbeddingBackend.name,
+                                 file.get('embedding_model'))
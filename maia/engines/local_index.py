@@ -0,0 +1,232 @@
+# Built-in libraries
+import os
+import json
+import shutil
+import tempfile
+import threading
+from typing import Any, Callable
+from collections import OrderedDict
+
+# 3rd part libraries
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.retriever import BaseRetriever
+from langchain.callbacks.manager import CallbackManagerForRetrieverRun
+
+# Local libraries
+from maia.src.utils import Utils
+from maia.src.vector_archive import iter_vector_archive
+from maia.src.custom_logging import log_function_execution, logger
+from maia.engines.embeddings import EmbeddingBackend
+
+# "auto" serves namespaces up to LOCAL_INDEX_MAX_VECTORS from memory, "off" always uses Pinecone
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "auto")
+LOCAL_INDEX_MAX_VECTORS = int(os.getenv("LOCAL_INDEX_MAX_VECTORS", 5000))
+LOCAL_INDEX_CACHE_MAX_BYTES = int(os.getenv("LOCAL_INDEX_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(tempfile.gettempdir(), "maia_local_index"))
+LOCAL_INDEX_TOP_K = 4
+
+
+class LocalVectorIndex(object):
+    """
+    Exact cosine top-k search over a namespace's vectors, memory-mapped from disk.
+
+    Rows are L2-normalized when the index is built, so a search is a single
+    matrix-vector product.
+    """
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.version = read_local_index_version(directory)
+        self.matrix = np.load(os.path.join(directory, "vectors.npy"), mmap_mode='r')
+        with open(os.path.join(directory, "metadata.json")) as metadata_file:
+            self.metadatas = json.load(metadata_file)
+
+    @property
+    def size_bytes(self) -> int:
+        return self.matrix.nbytes
+
+    def search(self, embedding: list[float], k: int = LOCAL_INDEX_TOP_K) -> list[tuple[float, dict, np.ndarray]]:
+        # Matches come with a copy of their normalized vector, so callers need not embed the chunks again
+        query = np.array(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self.matrix @ query
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k] if k else []
+        return [(float(scores[i]), self.metadatas[i], np.array(self.matrix[i]))
+                for i in sorted(best, key=lambda i: -scores[i])]
+
+
+def read_local_index_version(directory: str) -> int | None:
+    # The namespace version the index was built at, None when it was never built
+    try:
+        with open(os.path.join(directory, "version")) as version_file:
+            return int(version_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+@log_function_execution
+def build_local_index(s3_vectors_key: str, vector_count: int, directory: str, version: int = 0) -> None:
+    """
+    Streams a vectors archive from S3 into a normalized float32 .npy matrix and
+    a JSON list of metadata, without holding all vectors in memory. `version` is
+    the namespace version the archive belongs to.
+    """
+    tmp_directory = directory + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    matrix = None
+    metadatas = []
+    for row, vector in enumerate(iter_vector_archive(Utils().open_s3_file(s3_vectors_key))):
+        if row >= vector_count:
+            raise ValueError(f"build_local_index: {s3_vectors_key} has more than {vector_count} vectors")
+        values = np.asarray(vector['values'], dtype=np.float32)
+        if matrix is None:
+            matrix = np.lib.format.open_memmap(os.path.join(tmp_directory, "vectors.npy"), mode='w+',
+                                               dtype=np.float32, shape=(vector_count, len(values)))
+        matrix[row] = values / (np.linalg.norm(values) or 1.0)
+        metadatas.append(vector.get('metadata', {}))
+
+    if len(metadatas) != vector_count:
+        raise ValueError(f"build_local_index: {s3_vectors_key} has {len(metadatas)} vectors, expected {vector_count}")
+    matrix.flush()
+    with open(os.path.join(tmp_directory, "metadata.json"), "w") as metadata_file:
+        json.dump(metadatas, metadata_file)
+    with open(os.path.join(tmp_directory, "version"), "w") as version_file:
+        version_file.write(str(version))
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(tmp_directory, directory)
+
+
+class LocalIndexCache(object):
+    """
+    Per-process LRU of local indexes, bounded by the total size of their matrices.
+    """
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls(LOCAL_INDEX_DIR, LOCAL_INDEX_CACHE_MAX_BYTES)
+        return cls._instance
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+        self.namespace_locks = {}
+        self.eviction_listeners = []
+
+    def add_eviction_listener(self, listener: Callable[[str], Any]) -> None:
+        """
+        Registers `listener(namespace)`, called after a namespace's index is evicted
+        so holders of the evicted index (e.g. cached retrievers) can drop it.
+        """
+        self.eviction_listeners.append(listener)
+
+    def _namespace_directory(self, namespace: str) -> str:
+        return os.path.join(self.directory, namespace)
+
+    def _namespace_lock(self, namespace: str) -> threading.Lock:
+        with self.lock:
+            return self.namespace_locks.setdefault(namespace, threading.Lock())
+
+    @log_function_execution
+    def get(self, namespace: str, s3_vectors_key: str, vector_count: int, version: int = 0) -> LocalVectorIndex:
+        """
+        Returns the namespace's local index at `version`, building it from the S3
+        archive on a miss or when the index was built at another version.
+        """
+        with self.lock:
+            index = self.indexes.get(namespace)
+            if index is not None and index.version == version:
+                self.indexes.move_to_end(namespace)
+                return index
+
+        # One build per namespace at a time; other namespaces are not blocked
+        with self._namespace_lock(namespace):
+            with self.lock:
+                index = self.indexes.get(namespace)
+                if index is not None and index.version == version:
+                    return index
+            directory = self._namespace_directory(namespace)
+            if read_local_index_version(directory) != version:
+                build_local_index(s3_vectors_key, vector_count, directory, version)
+            index = LocalVectorIndex(directory)
+
+        with self.lock:
+            self.indexes[namespace] = index
+            evicted = self._evict()
+
+        # Outside the lock, listeners may take their own
+        for evicted_namespace in evicted:
+            for listener in self.eviction_listeners:
+                try:
+                    listener(evicted_namespace)
+                except Exception as error:
+                    logger.error(f"LocalIndexCache: {evicted_namespace}: eviction listener failed ERROR: {error}")
+        return index
+
+    def _evict(self) -> list[str]:
+        evicted = []
+        total = sum(index.size_bytes for index in self.indexes.values())
+        while total > self.max_bytes and len(self.indexes) > 1:
+            namespace, index = self.indexes.popitem(last=False)
+            total -= index.size_bytes
+            # Searches already running keep their mapping, the unlinked files go once it is closed
+            shutil.rmtree(index.directory, ignore_errors=True)
+            evicted.append(namespace)
+        return evicted
+
+    @log_function_execution
+    def invalidate(self, namespace: str) -> None:
+        with self.lock:
+            self.indexes.pop(namespace, None)
+        shutil.rmtree(self._namespace_directory(namespace), ignore_errors=True)
+
+
+class LocalVectorRetriever(BaseRetriever):
+    """
+    Retriever over a `LocalVectorIndex`, returning the same documents as the
+    Pinecone vectorstore retriever.
+    """
+    index: LocalVectorIndex
+    embedding_backend: EmbeddingBackend
+    k: int = LOCAL_INDEX_TOP_K
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def similarity_search_by_vector_with_values(self, embedding: list[float],
+                                                k: int = None) -> list[tuple[Document, float, np.ndarray]]:
+        # For callers that embed questions themselves; each match also has its vector
+        documents = []
+        for score, metadata, vector in self.index.search(embedding, k or self.k):
+            metadata = dict(metadata)
+            documents.append((Document(page_content=metadata.pop('text', ''), metadata=metadata), score, vector))
+        return documents
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        embedding = self.embedding_backend.embed_query(query)
+        return [document for document, _, _ in self.similarity_search_by_vector_with_values(embedding)]
+
+
+@log_function_execution
+def get_local_retriever(namespace: str, file: dict, embedding_backend: EmbeddingBackend,
+                        k: int = LOCAL_INDEX_TOP_K, version: int = 0) -> LocalVectorRetriever | None:
+    """
+    Returns a local retriever for small, ready namespaces, or None to use Pinecone.
+    """
+    vector_count = file.get('vector_count')
+    if LOCAL_INDEX_MODE == "off" or file.get('status') != 'Pronto' or not vector_count \
+            or vector_count > LOCAL_INDEX_MAX_VECTORS or not file.get('s3_vectors_key'):
+        return None
+    try:
+        index = LocalIndexCache.get_instance().get(namespace, file['s3_vectors_key'], vector_count, version)
+    except Exception as error:
+        logger.error(f"get_local_retriever: {namespace}: failed to load local index, using Pinecone ERROR: {error}")
+        return None
+    return LocalVectorRetriever(index=index, embedding_backend=embedding_backend, k=k)
@@ -0,0 +1,148 @@
+# Built-in libraries
+import os
+import time
+import math
+import multiprocessing
+import concurrent.futures
+from collections import deque
+from typing import Iterator
+
+# 3rd part libraries
+import pypdf
+from langchain.schema import Document
+from langchain.document_loaders.parsers.pdf import PyPDFParser
+
+# Local libraries
+from maia.src.custom_logging import log_function_execution, logger
+
+PARSE_MODE = os.getenv("PARSE_MODE", "parallel")
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+PARSE_MAX_PAGES_PER_SHARD = 16
+OCR_MODE = os.getenv("OCR_MODE", "adaptive")
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", 100))
+
+
+def page_has_images(page) -> bool:
+    resources = page.get("/Resources")
+    if not resources or "/XObject" not in resources.keys():
+        return False
+    xObject = resources["/XObject"].get_object()
+    return any(xObject[obj].get("/Subtype") == "/Image" for obj in xObject)
+
+
+def page_needs_ocr(page, text: str) -> bool:
+    """
+    Decides whether a page must go through image extraction/OCR.
+
+    Born-digital pages with a usable text layer are skipped; only pages whose
+    extracted text is shorter than OCR_MIN_TEXT_CHARS and that carry images are OCRed.
+    """
+    if OCR_MODE == "always":
+        return True
+    return len(text.strip()) < OCR_MIN_TEXT_CHARS and page_has_images(page)
+
+
+def parse_page(parser: PyPDFParser, page) -> tuple[str, dict]:
+    """
+    Extracts a page's text, running OCR only when the page needs it.
+
+    Returns:
+        tuple[str, dict]: The page text and its parsing metadata
+            (`ocr` and `parse_seconds`).
+    """
+    started_at = time.perf_counter()
+    text = page.extract_text()
+    ocr = parser.extract_images and page_needs_ocr(page, text)
+    if ocr:
+        text += parser._extract_images_from_page(page)
+    return text, {"ocr": ocr, "parse_seconds": round(time.perf_counter() - started_at, 4)}
+
+
+def log_parse_summary(file_name: str, parse_stats: list[dict]) -> None:
+    ocr_pages = sum(stats['ocr'] for stats in parse_stats)
+    total_seconds = sum(stats['parse_seconds'] for stats in parse_stats)
+    ocr_seconds = sum(stats['parse_seconds'] for stats in parse_stats if stats['ocr'])
+    logger.info(f"parse: {file_name}: {len(parse_stats)} pages in {total_seconds:.2f}s, "
+                f"{ocr_pages} OCRed pages in {ocr_seconds:.2f}s")
+
+
+@log_function_execution
+def iter_pdf_pages(file_name: str, extract_images: bool = True) -> Iterator[Document]:
+    """
+    Lazily parses a PDF one page at a time.
+
+    Yields the same documents as `PyPDFLoader(file_name, extract_images).load()`,
+    with `source` and `page` metadata, without holding every page in memory.
+    Each document also records its `ocr` decision and `parse_seconds`.
+    """
+    parser = PyPDFParser(extract_images=extract_images)
+    parse_stats = []
+    with open(file_name, "rb") as pdf_file:
+        pdf_reader = pypdf.PdfReader(pdf_file)
+        for page_number, page in enumerate(pdf_reader.pages):
+            text, stats = parse_page(parser, page)
+            parse_stats.append(stats)
+            yield Document(page_content=text, metadata={"source": file_name, "page": page_number, **stats})
+    log_parse_summary(file_name, parse_stats)
+
+
+def count_pdf_pages(file_name: str) -> int:
+    with open(file_name, "rb") as pdf_file:
+        return len(pypdf.PdfReader(pdf_file).pages)
+
+
+def build_page_shards(pages_count: int, workers: int) -> list[tuple[int, int]]:
+    """
+    Splits [0, pages_count) into contiguous (start, end) page ranges.
+
+    Shards are small enough that every worker gets several of them, so one slow
+    scanned range does not leave the other cores idle.
+    """
+    pages_per_shard = max(1, min(PARSE_MAX_PAGES_PER_SHARD, math.ceil(pages_count / (workers * 4))))
+    return [(start, min(start + pages_per_shard, pages_count)) for start in range(0, pages_count, pages_per_shard)]
+
+
+def _parse_page_range(file_name: str, start: int, end: int, extract_images: bool) -> list[tuple[int, str, dict]]:
+    # Runs inside a worker process, so it only returns plain (page, text, stats) tuples
+    parser = PyPDFParser(extract_images=extract_images)
+    with open(file_name, "rb") as pdf_file:
+        pdf_reader = pypdf.PdfReader(pdf_file)
+        return [(page_number, *parse_page(parser, pdf_reader.pages[page_number]))
+                for page_number in range(start, end)]
+
+
+@log_function_execution
+def iter_pdf_pages_parallel(file_name: str, extract_images: bool = True, max_workers: int = PARSE_WORKERS) -> Iterator[Document]:
+    """
+    Parses a PDF in page-range shards on a process pool.
+
+    Documents are yielded in page order with the same `source`/`page` metadata as
+    `iter_pdf_pages`. At most two shards per worker are in flight, so a slow
+    consumer does not make parsed pages pile up in memory.
+    """
+    shards = deque(build_page_shards(count_pdf_pages(file_name), max_workers))
+    if not shards:
+        return
+
+    parse_stats = []
+    mp_context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+        in_flight = deque()
+        while shards or in_flight:
+            while shards and len(in_flight) < max_workers * 2:
+                start, end = shards.popleft()
+                in_flight.append(executor.submit(_parse_page_range, file_name, start, end, extract_images))
+
+            for page_number, text, stats in in_flight.popleft().result():
+                parse_stats.append(stats)
+                yield Document(page_content=text, metadata={"source": file_name, "page": page_number, **stats})
+    log_parse_summary(file_name, parse_stats)
+
+
+def iter_pdf_documents(file_name: str, extract_images: bool = True) -> Iterator[Document]:
+    """
+    Parses a PDF with the strategy selected by PARSE_MODE ("parallel" or "serial").
+    """
+    if PARSE_MODE == "parallel" and PARSE_WORKERS > 1:
+        return iter_pdf_pages_parallel(file_name, extract_images=extract_images)
+    return iter_pdf_pages(file_name, extract_images=extract_images)
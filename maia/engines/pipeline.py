@@ -0,0 +1,108 @@
+# Built-in libraries
+import queue
+import threading
+from typing import Callable, Iterable, Iterator
+
+# Local libraries
+from maia.src.custom_logging import log_function_execution, logger
+
+PIPELINE_QUEUE_SIZE = 4
+
+_END_OF_STREAM = object()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+class Pipeline(object):
+    """
+    Runs a source and a chain of stages concurrently, one thread per stage.
+
+    Each stage is a function that takes an iterator of items and yields items
+    for the next stage. Stages are connected by bounded queues, so a slow stage
+    applies back-pressure upstream instead of letting items pile up in memory.
+    """
+    def __init__(self, name: str, queue_size: int = PIPELINE_QUEUE_SIZE) -> None:
+        self.name = name
+        self.queue_size = queue_size
+        self.stages = []
+        self.errors = []
+        self.aborted = threading.Event()
+
+    def add_stage(self, name: str, stage: Callable[[Iterator], Iterable]) -> "Pipeline":
+        self.stages.append((name, stage))
+        return self
+
+    def _put(self, out_queue: queue.Queue, item) -> None:
+        while True:
+            if self.aborted.is_set():
+                raise PipelineAborted()
+            try:
+                out_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _iter_queue(self, in_queue: queue.Queue) -> Iterator:
+        while True:
+            if self.aborted.is_set():
+                raise PipelineAborted()
+            try:
+                item = in_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END_OF_STREAM:
+                return
+            yield item
+
+    def _run_stage(self, name: str, items: Iterable, out_queue: queue.Queue | None) -> None:
+        try:
+            for item in items:
+                if out_queue is not None:
+                    self._put(out_queue, item)
+            if out_queue is not None:
+                self._put(out_queue, _END_OF_STREAM)
+        except PipelineAborted:
+            pass
+        except Exception as error:
+            logger.error(f"Pipeline {self.name}: stage {name} failed: {error}")
+            self.errors.append(error)
+            self.aborted.set()
+
+    @log_function_execution
+    def run(self, source: Iterable) -> None:
+        """
+        Feeds `source` through every stage and blocks until the last stage is drained.
+
+        Raises:
+            Exception: The first error raised by any stage.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [threading.Thread(target=self._run_stage, args=("source", source, queues[0]), daemon=True)]
+        for i, (name, stage) in enumerate(self.stages):
+            out_queue = queues[i + 1] if i + 1 < len(queues) else None
+            items = stage(self._iter_queue(queues[i]))
+            threads.append(threading.Thread(target=self._run_stage, args=(name, items, out_queue), daemon=True))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Groups a stream of items into lists of at most `size` items.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,45 +1,164 @@
 # Built-in modules
 import os
+import queue
+import asyncio
+import weakref
+import threading
+import concurrent.futures
 from uuid import uuid4
+from types import SimpleNamespace
+from typing import Iterator
 from datetime import datetime
 
 # 3rd part Modules
 import openai
 from langchain.chains import RetrievalQA
 from langchain.vectorstores import Pinecone
+from langchain.schema import Document
 from langchain.prompts import PromptTemplate
 from langchain.chat_models import ChatOpenAI
 from langchain.callbacks import get_openai_callback
-from langchain.embeddings import OpenAIEmbeddings
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.callbacks.openai_info import get_openai_token_cost_for_model
 
 # Local libraries
 from maia.src.custom_logging import log_function_execution, logger
 from maia.src.message import Message
 from maia.src.prompt_templates import template_br_1, template_br_2
 from maia.src.user import User
+from maia.src.rate_limiter import RateLimiter, PRIORITY_INTERACTIVE
+from maia.src.cache import TTLCache
+from maia.src.single_flight import SingleFlight
+from maia.src.blocking_executor import run_blocking
+from maia.engines.embeddings import count_tokens, get_file_embedding_backend, EmbeddingBackend
+from maia.engines.local_index import get_local_retriever, LocalIndexCache, LocalVectorRetriever
+from maia.engines.context import compact_context, normalize_line, CONTEXT_COMPACTION, CONTEXT_FETCH_K, CONTEXT_TOKEN_BUDGET
 from maia.database.supabase import SupabaseClient
+from maia.database.pinecone import PineconeClient
+from maia.database.answer_cache import AnswerCache
+from maia.database.namespace_versions import NamespaceVersions
 
 # Initialize Supabase
 supabase_client = SupabaseClient.get_instance()
 
-# Set OpenAIEmbeddings
-embeddings = OpenAIEmbeddings()
-
 MODEL_NAME_4K = "gpt-3.5-turbo-0613"
 MODEL_NAME_16K = "gpt-3.5-turbo-16k-0613"
 CHAIN_TYPE = "stuff"
 PROMPT_TEMPLATE = template_br_2
 CHAT_MODEL = "ChatOpenAI"
 VECTORSTORE = "pinecone"
+LOCAL_VECTORSTORE = "local"
 TEMPERATURE = 0.1
 
+# Context window per model, and the room kept free in it for the answer
+MODEL_CONTEXT_TOKENS = {MODEL_NAME_4K: 4096, MODEL_NAME_16K: 16384}
+COMPLETION_TOKENS_ESTIMATE = 500
+# Chat message framing OpenAI adds on top of the prompt text
+CHAT_MESSAGE_OVERHEAD_TOKENS = 20
+# The stuff chain joins the retrieved chunks with this separator
+CONTEXT_SEPARATOR = "\n\n"
+# Chunks retrieved per question; compaction picks the context out of more candidates
+RETRIEVAL_TOP_K = CONTEXT_FETCH_K if CONTEXT_COMPACTION == "on" else 4
+
+# Ready-to-run retrieval chains, keyed by (namespace, model name, streaming, namespace version),
+# and namespace retrievers and files, keyed by (namespace, namespace version): a version bumped
+# by another process, e.g. the files worker after an ingestion, makes the next lookup miss
+RETRIEVAL_CHAIN_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CHAIN_CACHE_MAX_ENTRIES", 512))
+RETRIEVAL_CHAIN_CACHE_TTL_SECONDS = int(os.getenv("RETRIEVAL_CHAIN_CACHE_TTL_SECONDS", 900))
+retrieval_chains = TTLCache(RETRIEVAL_CHAIN_CACHE_MAX_ENTRIES, RETRIEVAL_CHAIN_CACHE_TTL_SECONDS)
+namespace_retrievers = TTLCache(RETRIEVAL_CHAIN_CACHE_MAX_ENTRIES, RETRIEVAL_CHAIN_CACHE_TTL_SECONDS)
+namespace_files = TTLCache(RETRIEVAL_CHAIN_CACHE_MAX_ENTRIES, RETRIEVAL_CHAIN_CACHE_TTL_SECONDS)
+
+# In-flight `aquery` calls per process; the rest wait for a slot
+QUERY_MAX_CONCURRENCY = int(os.getenv("QUERY_MAX_CONCURRENCY", 200))
+# One semaphore per event loop, created on first use inside it
+query_semaphores = weakref.WeakKeyDictionary()
+# Namespaces searched at once by `query_namespaces`, and the chunks kept out of all their matches
+MULTI_QUERY_MAX_CONCURRENCY = int(os.getenv("MULTI_QUERY_MAX_CONCURRENCY", 16))
+MULTI_QUERY_TOP_K = int(os.getenv("MULTI_QUERY_TOP_K", RETRIEVAL_TOP_K))
+# Reciprocal rank fusion constant: matches are merged by 1 / (K + rank in their namespace)
+MULTI_QUERY_RRF_K = 60
+# Identical questions in flight, answered once
+query_flights = SingleFlight()
+# Retrievals and completions in flight per `batch_query` call
+BATCH_QUERY_MAX_CONCURRENCY = int(os.getenv("BATCH_QUERY_MAX_CONCURRENCY", 8))
+
 @log_function_execution
-def get_docs_from_vector_db(index_name: str, namespace: str):
-    return Pinecone.from_existing_index(embedding=embeddings, index_name=index_name, namespace=namespace)
+def route_model(query: str, docs: list) -> tuple[str, list, dict]:
+    """
+    Picks the smallest model whose context fits the prompt plus the answer.
+
+    When not even the 16K model fits, the lowest ranked chunks are dropped until
+    it does.
+
+    Args:
+        query (str): The user question.
+        docs (list): The retrieved documents, best match first.
+
+    Returns:
+        tuple: The model name, the documents to stuff and the routing metadata.
+    """
+    base_tokens = count_tokens(PROMPT_TEMPLATE) + count_tokens(query) + CHAT_MESSAGE_OVERHEAD_TOKENS
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    docs_tokens = [count_tokens(doc.page_content) for doc in docs]
+
+    def prompt_tokens(count: int) -> int:
+        return base_tokens + sum(docs_tokens[:count]) + separator_tokens * max(0, count - 1)
+
+    count = len(docs)
+    model_name = MODEL_NAME_16K
+    for candidate in (MODEL_NAME_4K, MODEL_NAME_16K):
+        if prompt_tokens(count) + COMPLETION_TOKENS_ESTIMATE <= MODEL_CONTEXT_TOKENS[candidate]:
+            model_name = candidate
+            break
+    else:
+        while count > 0 and prompt_tokens(count) + COMPLETION_TOKENS_ESTIMATE > MODEL_CONTEXT_TOKENS[model_name]:
+            count -= 1
+
+    routing = {
+        'routed_model': model_name,
+        'estimated_prompt_tokens': prompt_tokens(count),
+        'context_chunks': count,
+        'trimmed_chunks': len(docs) - count,
+    }
+    return model_name, docs[:count], routing
 
 @log_function_execution
-def create_llm_chain(model_name: str = MODEL_NAME_4K):
-    llm = ChatOpenAI(model_name=model_name, temperature=TEMPERATURE)
+def get_namespace_file(namespace: str) -> dict:
+    """
+    Returns the file behind a namespace: its embedding backend, vectors archive and size.
+    """
+    chat_id = namespace.split('.', 1)[1]
+    response = supabase_client.table('files') \
+                              .select('id, status, embedding_backend, embedding_model, s3_vectors_key, vector_count') \
+                              .eq('chat_id', chat_id) \
+                              .execute()
+    return response.data[0] if response.data else {}
+
+def get_cached_namespace_file(namespace: str, version: int = None) -> dict:
+    # Only ready files are cached, a file still processing gets its backend and size once 'Pronto'
+    if version is None:
+        version = NamespaceVersions.get_instance().get(namespace)
+    file = namespace_files.get((namespace, version))
+    if file is None:
+        file = get_namespace_file(namespace)
+        if file.get('status') == 'Pronto':
+            namespace_files.set((namespace, version), file)
+    return file
+
+def get_namespace_embedding_backend(namespace: str) -> EmbeddingBackend:
+    """
+    Returns the embedding backend the namespace's file was ingested with.
+    """
+    return get_file_embedding_backend(get_cached_namespace_file(namespace))
+
+@log_function_execution
+def get_docs_from_vector_db(index_name: str, namespace: str, embedding_backend: EmbeddingBackend):
+    return Pinecone.from_existing_index(embedding=embedding_backend, index_name=index_name, namespace=namespace)
+
+@log_function_execution
+def create_llm_chain(model_name: str = MODEL_NAME_4K, streaming: bool = False):
+    llm = ChatOpenAI(model_name=model_name, temperature=TEMPERATURE, streaming=streaming)
     
     return llm
 
@@ -54,38 +173,297 @@ def get_chain_prompt_template():
     return chain_type_kwargs
 
 @log_function_execution
-def get_retrieval_qa(llm, docsearch, chain_type_kwargs):
+def get_retriever(namespace: str, embedding_backend: EmbeddingBackend, version: int = 0):
+    # Small namespaces are searched in memory, the rest on Pinecone
+    retriever = get_local_retriever(namespace, get_cached_namespace_file(namespace, version), embedding_backend,
+                                    RETRIEVAL_TOP_K, version)
+    if retriever is None:
+        vectorstore = get_docs_from_vector_db(embedding_backend.index_name, namespace, embedding_backend)
+        retriever = vectorstore.as_retriever(search_kwargs={'k': RETRIEVAL_TOP_K})
+    return retriever
+
+def get_cached_retriever(namespace: str, version: int = None):
+    """
+    Returns the cached retriever of a namespace, shared by its chains and by the
+    searches that embed the question themselves, building it on a miss.
+    """
+    if version is None:
+        version = NamespaceVersions.get_instance().get(namespace)
+    return namespace_retrievers.get_or_create((namespace, version), lambda: get_retriever(
+        namespace, get_file_embedding_backend(get_cached_namespace_file(namespace, version)), version))
+
+@log_function_execution
+def get_retrieval_qa(llm, retriever, chain_type_kwargs):
     qa = RetrievalQA.from_chain_type(llm=llm, 
                                      chain_type=CHAIN_TYPE, 
-                                     retriever=docsearch.as_retriever(),
+                                     retriever=retriever,
                                      chain_type_kwargs=chain_type_kwargs)
     
     return qa    
 
 @log_function_execution
-def query_llm_chain_with_callback(llm, docsearch, chain_type_kwargs: dict, query: str) -> dict:
-    def run_query(llm_model, model_name):
-        response = {
-            'error': False,
-            'model_name': model_name,
-            'output_message': None,
-            'openai_callback': None,
-            'error_code': None,
-            'error_message': None,
-            'chain_type': CHAIN_TYPE,
-            'prompt_template': PROMPT_TEMPLATE,
-            'vectorstore': VECTORSTORE,
-            'temperature': TEMPERATURE,
-            'chat_model': CHAT_MODEL,
+def build_retrieval_chain(namespace: str, model_name: str = MODEL_NAME_4K, streaming: bool = False,
+                          version: int = 0) -> RetrievalQA:
+    retriever = get_cached_retriever(namespace, version)
+    llm = create_llm_chain(model_name, streaming)
+    chain_type_kwargs = get_chain_prompt_template()
+    return get_retrieval_qa(llm, retriever, chain_type_kwargs)
+
+def get_retrieval_chain(namespace: str, model_name: str = MODEL_NAME_4K, streaming: bool = False) -> RetrievalQA:
+    """
+    Returns the cached retrieval chain of a namespace and model, building it on a miss.
+    """
+    version = NamespaceVersions.get_instance().get(namespace)
+    return retrieval_chains.get_or_create((namespace, model_name, streaming, version),
+                                          lambda: build_retrieval_chain(namespace, model_name, streaming, version))
+
+def invalidate_retrieval_chains(namespace: str) -> int:
+    """
+    Drops this process' cached chains of a namespace, e.g. after its local index was evicted.
+    """
+    namespace_files.invalidate(lambda key: key[0] == namespace)
+    namespace_retrievers.invalidate(lambda key: key[0] == namespace)
+    return retrieval_chains.invalidate(lambda key: key[0] == namespace)
+
+def invalidate_namespace_caches(namespace: str) -> None:
+    """
+    Drops everything cached about a namespace; called whenever its vectors change.
+
+    The caches of this process are dropped at once; other processes see the bumped
+    namespace version on their next lookup and rebuild theirs.
+    """
+    NamespaceVersions.get_instance().bump(namespace)
+    invalidate_retrieval_chains(namespace)
+    LocalIndexCache.get_instance().invalidate(namespace)
+    AnswerCache.get_instance().invalidate(namespace)
+
+# Cached chains would keep an evicted index mapped, outside the cache size bound
+LocalIndexCache.get_instance().add_eviction_listener(invalidate_retrieval_chains)
+
+def get_retrieval_chain_cache_stats() -> dict:
+    return retrieval_chains.get_stats()
+
+def new_llm_response(model_name: str, routing: dict) -> dict:
+    return {
+        'error': False,
+        'model_name': model_name,
+        'output_message': None,
+        'openai_callback': None,
+        'error_code': None,
+        'error_message': None,
+        'chain_type': CHAIN_TYPE,
+        'prompt_template': PROMPT_TEMPLATE,
+        'vectorstore': routing.get('vectorstore', VECTORSTORE),
+        'temperature': TEMPERATURE,
+        'chat_model': CHAT_MODEL,
+        'routing': routing,
+        'answer_cache': {'hit': False},
+    }
+
+def empty_openai_callback() -> SimpleNamespace:
+    return SimpleNamespace(total_tokens=0, prompt_tokens=0, completion_tokens=0, total_cost=0)
+
+@log_function_execution
+def get_cached_answer(namespace: str, query: str) -> tuple[dict | None, list[float] | None]:
+    """
+    Looks up a previous answer to a semantically equivalent question.
+
+    Returns:
+        tuple: The cached response (None on a miss) and the question embedding,
+            reused to cache the fresh answer on a miss.
+    """
+    answer_cache = AnswerCache.get_instance()
+    if not answer_cache.enabled:
+        return None, None
+
+    try:
+        embedding_backend = get_namespace_embedding_backend(namespace)
+        embedding = embedding_backend.embed_query(query)
+    except Exception as error:
+        logger.error(f"query: {namespace}: failed to embed question for the answer cache ERROR: {error}")
+        return None, None
+
+    return lookup_cached_answer(namespace, embedding_backend, embedding), embedding
+
+def lookup_cached_answer(namespace: str, embedding_backend: EmbeddingBackend, embedding: list[float]) -> dict | None:
+    entry = AnswerCache.get_instance().get(namespace, embedding_backend.model, embedding)
+    if entry is None:
+        return None
+
+    response = new_llm_response(entry['model_name'], {})
+    response.update({
+        'output_message': entry['answer'],
+        'openai_callback': empty_openai_callback(),
+        'answer_cache': {
+            'hit': True,
+            'similarity': entry['similarity'],
+            'cached_question': entry['question'],
         }
-        qa = get_retrieval_qa(llm_model, docsearch, chain_type_kwargs)
+    })
+    return response
+
+def cache_answer(namespace: str, query: str, embedding: list[float] | None, response: dict) -> None:
+    if embedding is None or response['error']:
+        return
+    embedding_backend = get_namespace_embedding_backend(namespace)
+    AnswerCache.get_instance().set(namespace, embedding_backend.model, embedding, query,
+                                   response['output_message'], response['model_name'])
+
+def context_token_budget(query: str) -> int:
+    """
+    The context tokens compaction may keep: CONTEXT_TOKEN_BUDGET when set, else
+    whatever the 4K model has room for next to the prompt, question and answer.
+    """
+    if CONTEXT_TOKEN_BUDGET is not None:
+        return CONTEXT_TOKEN_BUDGET
+    return MODEL_CONTEXT_TOKENS[MODEL_NAME_4K] - COMPLETION_TOKENS_ESTIMATE - CHAT_MESSAGE_OVERHEAD_TOKENS \
+        - count_tokens(PROMPT_TEMPLATE) - count_tokens(query) - count_tokens(CONTEXT_SEPARATOR) * RETRIEVAL_TOP_K
+
+def compact_retrieved_context(namespace: str, query: str, docs: list, vectors: list = None,
+                              query_embedding: list[float] = None) -> tuple[list, dict]:
+    if CONTEXT_COMPACTION != "on":
+        return docs, {}
+    return compact_context(query, docs, get_namespace_embedding_backend(namespace), context_token_budget(query),
+                           embeddings=vectors, query_embedding=query_embedding)
+
+def route_retrieved(namespace: str, query: str, docs: list, vectorstore: str, vectors: list = None,
+                    query_embedding: list[float] = None) -> tuple[str, list, dict]:
+    docs, compaction = compact_retrieved_context(namespace, query, docs, vectors, query_embedding)
+    model_name, docs, routing = route_model(query, docs)
+    routing.update(compaction, vectorstore=vectorstore)
+    return model_name, docs, routing
+
+def pinecone_search(namespace: str, embedding_backend: EmbeddingBackend, embedding: list[float],
+                    k: int) -> list[tuple]:
+    results = PineconeClient.get_index(embedding_backend.index_name).query(vector=embedding,
+                                                                           top_k=k,
+                                                                           include_metadata=True,
+                                                                           include_values=True,
+                                                                           namespace=namespace)
+    matches = []
+    for match in results['matches']:
+        metadata = dict(match['metadata'] or {})
+        matches.append((Document(page_content=metadata.pop('text', ''), metadata=metadata),
+                        match['score'], match['values'] or None))
+    return matches
+
+def search_namespace(namespace: str, embedding: list[float], k: int = RETRIEVAL_TOP_K) -> tuple[list[tuple], str]:
+    """
+    Searches a namespace with a question embedding computed beforehand.
+
+    Returns:
+        tuple: The (document, score, vector) matches, best first, and the vectorstore name.
+    """
+    retriever = get_cached_retriever(namespace)
+    if isinstance(retriever, LocalVectorRetriever):
+        return retriever.similarity_search_by_vector_with_values(embedding, k), LOCAL_VECTORSTORE
+    return pinecone_search(namespace, get_namespace_embedding_backend(namespace), embedding, k), VECTORSTORE
+
+def route_matches(namespace: str, query: str, matches: list[tuple], vectorstore: str,
+                  query_embedding: list[float]) -> tuple[str, list, dict]:
+    # The vectors stored with the chunks drive compaction, nothing is embedded again
+    return route_retrieved(namespace, query, [doc for doc, _, _ in matches], vectorstore,
+                           [vector for _, _, vector in matches], query_embedding)
+
+def retrieve_and_route(namespace: str, query: str, embedding: list[float] = None) -> tuple[str, list, dict]:
+    # Retrieve once, then route to the model the prompt fits in
+    if embedding is None:
+        embedding = get_namespace_embedding_backend(namespace).embed_query(query)
+    matches, vectorstore = search_namespace(namespace, embedding)
+    return route_matches(namespace, query, matches, vectorstore, embedding)
+
+def retrieval_error_response(namespace: str, error: Exception) -> dict:
+    logger.error(f"query: {namespace}: failed to retrieve context ERROR: {error}")
+    response = new_llm_response(MODEL_NAME_4K, {})
+    response.update({
+        'error': True,
+        'error_message': error
+    })
+    return response
+
+def is_4k_context_exceeded(response: dict) -> bool:
+    return response['model_name'] == MODEL_NAME_4K and response['error'] \
+        and response['error_code'] == 'context_length_exceeded'
+
+def run_completion(namespace: str, query: str, model_name: str, docs: list, routing: dict) -> dict:
+    response = new_llm_response(model_name, routing)
+    try:
+        qa = get_retrieval_chain(namespace, model_name)
+        # Completions share the cluster-wide OpenAI budget
+        RateLimiter.get_instance().acquire('chat', routing['estimated_prompt_tokens'] + COMPLETION_TOKENS_ESTIMATE,
+                                           PRIORITY_INTERACTIVE)
+        with get_openai_callback() as cb:
+            openai_response = qa.combine_documents_chain.run(input_documents=docs, question=query)
+            response.update({
+                'output_message': openai_response,
+                'openai_callback': cb
+            })
+    except openai.InvalidRequestError as error:
+        logger.warn(f'Message Length Exceed, using {model_name}.')
+        response.update({
+            'error': True,
+            'error_code': error.code,
+            'error_message': error
+        })
+    except Exception as error:
+        logger.error(f"OpenAI: {model_name}: failed to query ERROR: {error}")
+        response.update({
+            'error': True,
+            'error_message': error
+        })
+    return response
+
+def run_completion_with_fallback(namespace: str, query: str, model_name: str, docs: list, routing: dict) -> dict:
+    response = run_completion(namespace, query, model_name, docs, routing)
+    if is_4k_context_exceeded(response):
+        logger.warn("Token estimate undershot the 4K context, using 16K model")
+        response = run_completion(namespace, query, MODEL_NAME_16K, docs,
+                                  dict(routing, routed_model=MODEL_NAME_16K, fallback=True))
+    return response
+
+@log_function_execution
+def query_llm_chain_with_callback(namespace: str, query: str, embedding: list[float] = None) -> dict:
+    try:
+        model_name, docs, routing = retrieve_and_route(namespace, query, embedding)
+    except Exception as error:
+        return retrieval_error_response(namespace, error)
+
+    return run_completion_with_fallback(namespace, query, model_name, docs, routing)
+
+class QueueCallbackHandler(BaseCallbackHandler):
+    """
+    Forwards the tokens of a streaming chat model to a queue.
+    """
+    def __init__(self, tokens: queue.Queue) -> None:
+        self.tokens = tokens
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.tokens.put(token)
+
+def estimate_openai_callback(model_name: str, prompt_tokens: int, output_message: str) -> SimpleNamespace:
+    """
+    Builds the usage OpenAI does not report for streamed completions, counted with tiktoken.
+    """
+    completion_tokens = count_tokens(output_message or "")
+    total_cost = get_openai_token_cost_for_model(model_name, prompt_tokens) \
+        + get_openai_token_cost_for_model(model_name, completion_tokens, is_completion=True)
+    return SimpleNamespace(total_tokens=prompt_tokens + completion_tokens,
+                           prompt_tokens=prompt_tokens,
+                           completion_tokens=completion_tokens,
+                           total_cost=total_cost)
+
+def stream_completion(namespace: str, query: str, model_name: str, docs: list, routing: dict) -> Iterator[dict]:
+    response = new_llm_response(model_name, routing)
+    tokens = queue.Queue()
+    done = object()
+
+    def generate():
         try:
-            with get_openai_callback() as cb:
-                openai_response = qa.run(query)
-                response.update({
-                    'output_message': openai_response,
-                    'openai_callback': cb
-                })
+            qa = get_retrieval_chain(namespace, model_name, streaming=True)
+            RateLimiter.get_instance().acquire('chat', routing['estimated_prompt_tokens'] + COMPLETION_TOKENS_ESTIMATE,
+                                               PRIORITY_INTERACTIVE)
+            response['output_message'] = qa.combine_documents_chain.run(input_documents=docs, question=query,
+                                                                        callbacks=[QueueCallbackHandler(tokens)])
         except openai.InvalidRequestError as error:
             logger.warn(f'Message Length Exceed, using {model_name}.')
             response.update({
@@ -94,27 +472,355 @@ def query_llm_chain_with_callback(llm, docsearch, chain_type_kwargs: dict, query
                 'error_message': error
             })
         except Exception as error:
-            logger.error(f"OpenAI: {model_name}: failed to query ERROR: {error}")
+            logger.error(f"OpenAI: {model_name}: failed to stream query ERROR: {error}")
             response.update({
                 'error': True,
                 'error_message': error
             })
-        return response
+        finally:
+            tokens.put(done)
 
-    response_4k = run_query(llm, MODEL_NAME_4K)
-    if response_4k['error'] and response_4k['error_code'] == 'context_length_exceeded':
-        logger.warn("Previous message exceed 4K context, using 16K model")
-        llm_16k = create_llm_chain(MODEL_NAME_16K)
-        response_16k = run_query(llm_16k, MODEL_NAME_16K)
-        return response_16k
+    threading.Thread(target=generate, daemon=True).start()
+    while (token := tokens.get()) is not done:
+        yield {'token': token}
 
-    return response_4k
+    if not response['error']:
+        response['openai_callback'] = estimate_openai_callback(model_name, routing['estimated_prompt_tokens'],
+                                                               response['output_message'])
+    yield {'response': response}
+
+@log_function_execution
+def query_stream(namespace: str, query: str) -> Iterator[dict]:
+    """
+    Answers a question token by token.
+
+    Yields:
+        dict: {'token': str} events as the answer is generated, then a single
+            {'response': dict} event shaped like the `query` response.
+    """
+    cached_response, embedding = get_cached_answer(namespace, query)
+    if cached_response:
+        yield {'token': cached_response['output_message']}
+        yield {'response': cached_response}
+        return
+
+    try:
+        model_name, docs, routing = retrieve_and_route(namespace, query, embedding)
+    except Exception as error:
+        yield {'response': retrieval_error_response(namespace, error)}
+        return
+
+    streamed = False
+    for event in stream_completion(namespace, query, model_name, docs, routing):
+        if 'token' in event:
+            streamed = True
+        elif not streamed and is_4k_context_exceeded(event['response']):
+            # Nothing was sent yet, so the 16K model can still answer
+            logger.warn("Token estimate undershot the 4K context, using 16K model")
+            for fallback_event in stream_completion(namespace, query, MODEL_NAME_16K, docs,
+                                                    dict(routing, routed_model=MODEL_NAME_16K, fallback=True)):
+                if 'response' in fallback_event:
+                    cache_answer(namespace, query, embedding, fallback_event['response'])
+                yield fallback_event
+            return
+        else:
+            cache_answer(namespace, query, embedding, event['response'])
+        yield event
+
+def answer_query(namespace: str, query: str) -> dict:
+    cached_response, embedding = get_cached_answer(namespace, query)
+    if cached_response:
+        return cached_response
+
+    llm_response = query_llm_chain_with_callback(namespace, query, embedding)
+    cache_answer(namespace, query, embedding, llm_response)
+    return llm_response
 
 @log_function_execution
 def query(namespace: str, query: str) -> dict:
-    vectorstore = get_docs_from_vector_db(os.getenv('PINECONE_INDEX'), namespace)
-    llm = create_llm_chain()
-    chain_type_kwargs = get_chain_prompt_template()
-    llm_response = query_llm_chain_with_callback(llm, vectorstore, chain_type_kwargs, query)
+    """
+    Answers a question about a namespace.
+
+    Identical questions (same namespace and normalized text) asked while one is
+    being answered wait for that answer instead of querying again; they get it
+    with zero usage and 'coalesced' set, so each request is still recorded once
+    and the tokens are counted once. The namespace fixes the embedding backend
+    and the question fixes the routed model, so neither is part of the key.
+    """
+    key = (namespace, normalize_line(query))
+    llm_response, coalesced = query_flights.do(key, lambda: answer_query(namespace, query))
+    if coalesced:
+        llm_response = dict(llm_response, openai_callback=empty_openai_callback(), coalesced=True)
     return llm_response
-        
+
+def fuse_matches(matches_by_namespace: dict[str, list[tuple]], k: int = MULTI_QUERY_TOP_K) -> list[tuple]:
+    """
+    Merges the ranked matches of several namespaces by reciprocal rank fusion.
+
+    Args:
+        matches_by_namespace (dict): The (document, score, vector) matches of each namespace, best first.
+        k (int): The matches kept.
+
+    Returns:
+        list[tuple]: The best (fused score, document, vector) matches, each document's
+            metadata tagged with its 'namespace'.
+    """
+    fused = []
+    for namespace, matches in matches_by_namespace.items():
+        for rank, (doc, _, vector) in enumerate(matches):
+            doc.metadata['namespace'] = namespace
+            fused.append((1 / (MULTI_QUERY_RRF_K + rank + 1), doc, vector))
+    fused.sort(key=lambda match: -match[0])
+    return fused[:k]
+
+@log_function_execution
+def query_namespaces(namespaces: list[str], query: str) -> dict:
+    """
+    Answers one question from the files of several namespaces.
+
+    1. The question is embedded once per embedding model in use
+    2. Every namespace is searched concurrently, at most MULTI_QUERY_MAX_CONCURRENCY at a time
+    3. Matches are merged into a global top MULTI_QUERY_TOP_K by reciprocal rank fusion,
+       since raw scores of different embedding models are not comparable
+    4. The merged chunks are compacted to the context token budget in a single
+       embedding space and answered in a single completion
+
+    A namespace that fails to load or search is skipped; the query fails only when all do.
+
+    Returns:
+        dict: A response shaped like the `query` response; 'routing' also has the
+            'namespaces' searched and each context chunk's metadata its 'namespace'.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MULTI_QUERY_MAX_CONCURRENCY) as executor:
+        backends = {}
+        for namespace, future in [(namespace, executor.submit(get_namespace_embedding_backend, namespace))
+                                  for namespace in namespaces]:
+            try:
+                backends[namespace] = future.result()
+            except Exception as error:
+                logger.error(f"query_namespaces: {namespace}: failed to load file, skipping ERROR: {error}")
+
+        embeddings = {}
+        for embedding_backend in backends.values():
+            if embedding_backend.model not in embeddings:
+                try:
+                    embeddings[embedding_backend.model] = embedding_backend.embed_query(query)
+                except Exception as error:
+                    logger.error(f"query_namespaces: failed to embed question with {embedding_backend.model} ERROR: {error}")
+                    embeddings[embedding_backend.model] = None
+
+        searches = {namespace: executor.submit(search_namespace, namespace, embeddings[embedding_backend.model],
+                                               MULTI_QUERY_TOP_K)
+                    for namespace, embedding_backend in backends.items()
+                    if embeddings[embedding_backend.model] is not None}
+        matches_by_namespace = {}
+        vectorstores = set()
+        for namespace, search in searches.items():
+            try:
+                namespace_matches, vectorstore = search.result()
+            except Exception as error:
+                logger.error(f"query_namespaces: {namespace}: failed to search, skipping ERROR: {error}")
+                continue
+            matches_by_namespace[namespace] = namespace_matches
+            vectorstores.add(vectorstore)
+
+    searched = list(matches_by_namespace)
+    if not searched:
+        return retrieval_error_response(",".join(namespaces), ValueError("no namespace could be searched"))
+
+    matches = fuse_matches(matches_by_namespace)
+    # The combine chain does not depend on the namespace, any searched one serves it; its
+    # model compacts the context, reusing only the stored vectors of that model, so chunks
+    # of namespaces embedded with another model are embedded again in the same space
+    namespace = searched[0]
+    model = backends[namespace].model
+    # A vector that does not fit the question embedding only costs its chunk a new embedding
+    vectors = [vector if backends[doc.metadata['namespace']].model == model and vector is not None
+               and len(vector) == len(embeddings[model]) else None for _, doc, vector in matches]
+    try:
+        model_name, docs, routing = route_retrieved(namespace, query, [doc for _, doc, _ in matches],
+                                                    ",".join(sorted(vectorstores)), vectors, embeddings[model])
+    except Exception as error:
+        return retrieval_error_response(",".join(searched), error)
+    routing['namespaces'] = searched
+    return run_completion_with_fallback(namespace, query, model_name, docs, routing)
+
+def get_query_flight_stats() -> dict:
+    return query_flights.get_stats()
+
+@log_function_execution
+def share_retrieved_chunks(embedding_backend: EmbeddingBackend, retrieved: dict[int, tuple[list[tuple], str]]) -> int:
+    """
+    Questions about one document often retrieve the same chunks. Rewrites `retrieved`
+    in place so each distinct chunk is one document and one vector shared by every
+    question, and chunks retrieved without their stored vector are embedded once for
+    the whole batch instead of once per question at compaction.
+
+    Returns:
+        int: The number of distinct chunks across the batch.
+    """
+    chunks = {}
+    for matches, _ in retrieved.values():
+        for doc, _, vector in matches:
+            key = normalize_line(doc.page_content)
+            if key not in chunks or (chunks[key][1] is None and vector is not None):
+                chunks[key] = (doc, vector)
+
+    missing = [key for key, (_, vector) in chunks.items() if vector is None]
+    if missing and CONTEXT_COMPACTION == "on":
+        try:
+            vectors = embedding_backend.embed_documents([chunks[key][0].page_content for key in missing],
+                                                        priority=PRIORITY_INTERACTIVE)
+            for key, vector in zip(missing, vectors):
+                chunks[key] = (chunks[key][0], vector)
+        except Exception as error:
+            logger.error(f"batch_query: failed to embed shared chunks ERROR: {error}")
+
+    for i, (matches, vectorstore) in retrieved.items():
+        shared_matches = []
+        for doc, score, _ in matches:
+            shared_doc, vector = chunks[normalize_line(doc.page_content)]
+            shared_matches.append((shared_doc, score, vector))
+        retrieved[i] = (shared_matches, vectorstore)
+    return len(chunks)
+
+def batch_query(namespace: str, questions: list[str]) -> list[dict]:
+    """
+    Answers many questions about one namespace, e.g. a scripted document review.
+
+    1. Every question is embedded in one request and looked up in the answer cache
+    2. The remaining questions are searched in parallel with their embeddings, on
+       the namespace's cached retriever
+    3. Chunks retrieved by several questions are shared, see `share_retrieved_chunks`
+    4. Each question's context is compacted with the vectors stored with its chunks
+    5. Completions run concurrently, at most BATCH_QUERY_MAX_CONCURRENCY at a time
+
+    Args:
+        namespace (str): The chat namespace.
+        questions (list[str]): The questions, answered independently.
+
+    Returns:
+        list[dict]: One response per question, in order, shaped like the `query`
+            response plus the 'question' it answers; 'openai_callback' holds its usage.
+    """
+    responses = [None] * len(questions)
+    try:
+        embedding_backend = get_namespace_embedding_backend(namespace)
+        embeddings = embedding_backend.embed_documents(questions)
+    except Exception as error:
+        error_response = retrieval_error_response(namespace, error)
+        return [dict(error_response, question=question) for question in questions]
+
+    pending = []
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            responses[i] = retrieval_error_response(namespace, ValueError("failed to embed question"))
+            continue
+        if AnswerCache.get_instance().enabled:
+            responses[i] = lookup_cached_answer(namespace, embedding_backend, embedding)
+        if responses[i] is None:
+            pending.append(i)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=BATCH_QUERY_MAX_CONCURRENCY) as executor:
+        searches = {i: executor.submit(search_namespace, namespace, embeddings[i]) for i in pending}
+        retrieved = {}
+        for i, search in searches.items():
+            try:
+                retrieved[i] = search.result()
+            except Exception as error:
+                responses[i] = retrieval_error_response(namespace, error)
+
+        chunks_count = share_retrieved_chunks(embedding_backend, retrieved)
+        logger.info(f"batch_query: {namespace}: {len(retrieved)} questions share {chunks_count} distinct chunks")
+
+        def answer(i):
+            matches, vectorstore = retrieved[i]
+            model_name, docs, routing = route_matches(namespace, questions[i], matches, vectorstore, embeddings[i])
+            return run_completion_with_fallback(namespace, questions[i], model_name, docs, routing)
+
+        completions = {i: executor.submit(answer, i) for i in retrieved}
+        for i, completion in completions.items():
+            try:
+                responses[i] = completion.result()
+            except Exception as error:
+                responses[i] = retrieval_error_response(namespace, error)
+            cache_answer(namespace, questions[i], embeddings[i], responses[i])
+
+    return [dict(response, question=question) for question, response in zip(questions, responses)]
+
+def get_query_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in query_semaphores:
+        query_semaphores[loop] = asyncio.Semaphore(QUERY_MAX_CONCURRENCY)
+    return query_semaphores[loop]
+
+async def aget_cached_answer(namespace: str, query: str) -> tuple[dict | None, list[float]]:
+    # Unlike `get_cached_answer` the embedding is always returned, retrieval reuses it
+    embedding_backend = await run_blocking(get_namespace_embedding_backend, namespace)
+    embedding = await embedding_backend.aembed_query(query)
+    return await run_blocking(lookup_cached_answer, namespace, embedding_backend, embedding), embedding
+
+async def aretrieve_and_route(namespace: str, query: str, embedding: list[float]) -> tuple[str, list, dict]:
+    matches, vectorstore = await run_blocking(search_namespace, namespace, embedding)
+    return await run_blocking(route_matches, namespace, query, matches, vectorstore, embedding)
+
+async def arun_completion(namespace: str, query: str, model_name: str, docs: list, routing: dict) -> dict:
+    response = new_llm_response(model_name, routing)
+    try:
+        qa = await run_blocking(get_retrieval_chain, namespace, model_name)
+        await RateLimiter.get_instance().aacquire('chat', routing['estimated_prompt_tokens'] + COMPLETION_TOKENS_ESTIMATE,
+                                                  PRIORITY_INTERACTIVE)
+        with get_openai_callback() as cb:
+            openai_response = await qa.combine_documents_chain.arun(input_documents=docs, question=query)
+            response.update({
+                'output_message': openai_response,
+                'openai_callback': cb
+            })
+    except openai.InvalidRequestError as error:
+        logger.warn(f'Message Length Exceed, using {model_name}.')
+        response.update({
+            'error': True,
+            'error_code': error.code,
+            'error_message': error
+        })
+    except Exception as error:
+        logger.error(f"OpenAI: {model_name}: failed to query ERROR: {error}")
+        response.update({
+            'error': True,
+            'error_message': error
+        })
+    return response
+
+@log_function_execution
+async def aquery(namespace: str, query: str) -> dict:
+    """
+    Async `query`: the question embedding, rate limiter waits and completion are
+    awaited on async clients, so one event loop can serve many questions at once;
+    at most QUERY_MAX_CONCURRENCY run at a time per loop. The remaining short
+    blocking calls (Supabase, Redis, Pinecone) run on the dedicated blocking
+    executor, sized to the same limit.
+
+    Cancelling the awaiting task (e.g. on client disconnect) stops the query at
+    its current step and nothing is cached.
+    """
+    async with get_query_semaphore():
+        try:
+            cached_response, embedding = await aget_cached_answer(namespace, query)
+        except Exception as error:
+            return retrieval_error_response(namespace, error)
+        if cached_response:
+            return cached_response
+
+        try:
+            model_name, docs, routing = await aretrieve_and_route(namespace, query, embedding)
+        except Exception as error:
+            return retrieval_error_response(namespace, error)
+
+        response = await arun_completion(namespace, query, model_name, docs, routing)
+        if is_4k_context_exceeded(response):
+            logger.warn("Token estimate undershot the 4K context, using 16K model")
+            response = await arun_completion(namespace, query, MODEL_NAME_16K, docs,
+                                             dict(routing, routed_model=MODEL_NAME_16K, fallback=True))
+
+        await run_blocking(cache_answer, namespace, query, embedding, response)
+        return response
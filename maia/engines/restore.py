@@ -0,0 +1,116 @@
+# Built-in libraries
+import argparse
+import concurrent.futures
+from typing import Iterator
+
+# Local libraries
+from maia.engines.upsert import ConcurrentUpserter
+from maia.engines.query import invalidate_namespace_caches
+from maia.src.utils import Utils
+from maia.src.vector_archive import iter_vector_archive
+from maia.src.custom_logging import log_function_execution, logger
+from maia.database.supabase import SupabaseClient
+from maia.database.pinecone import PineconeClient
+
+supabase_client = SupabaseClient.get_instance()
+
+RESTORE_FILE_WORKERS = 4
+
+
+@log_function_execution
+def iter_archived_vectors(s3_vectors_key: str) -> Iterator[dict]:
+    """
+    Streams the vectors archived by `embed()` from S3, in either archive format.
+    """
+    yield from iter_vector_archive(Utils().open_s3_file(s3_vectors_key))
+
+
+@log_function_execution
+def restore_namespace(s3_vectors_key: str, namespace: str, index_name: str = None) -> int:
+    """
+    Upserts an S3 vectors archive into a Pinecone namespace, without any OpenAI call.
+
+    Args:
+        s3_vectors_key (str): The archive key, as stored in `files.s3_vectors_key`.
+        namespace (str): The target namespace.
+        index_name (str): The target index. Defaults to PINECONE_INDEX.
+
+    Returns:
+        int: The number of vectors restored.
+    """
+    with ConcurrentUpserter(namespace, index=PineconeClient.get_index(index_name)) as upserter:
+        for vector in iter_archived_vectors(s3_vectors_key):
+            upserter.add([vector])
+    invalidate_namespace_caches(namespace)
+    logger.info(f"restore_namespace: restored {upserter.upserted_count} vectors from {s3_vectors_key} into {namespace}")
+    return upserter.upserted_count
+
+
+@log_function_execution
+def restore_file(file: dict, namespace: str = None, index_name: str = None) -> int:
+    """
+    Restores a file's vectors into its chat namespace, or into `namespace` when given.
+    """
+    namespace = namespace or f"{file['user_id']}.{file['chat_id']}"
+    return restore_namespace(file['s3_vectors_key'], namespace, index_name)
+
+
+@log_function_execution
+def restore_files(files: list[dict], index_name: str = None) -> dict[str, int]:
+    """
+    Restores several files in parallel into their own namespaces.
+
+    Returns:
+        dict[str, int]: Restored vectors count by file id, -1 for failed files.
+    """
+    restored = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=RESTORE_FILE_WORKERS) as executor:
+        futures = {executor.submit(restore_file, file, None, index_name): file for file in files}
+        for future in concurrent.futures.as_completed(futures):
+            file = futures[future]
+            try:
+                restored[file['id']] = future.result()
+            except Exception as e:
+                logger.error(f"restore_files: Error restoring file {file['id']}: {e}")
+                restored[file['id']] = -1
+    return restored
+
+
+def get_files_to_restore(file_id: str = None, user_id: str = None) -> list[dict]:
+    query = supabase_client.table('files') \
+                           .select('id, user_id, chat_id, s3_vectors_key') \
+                           .eq('status', 'Pronto') \
+                           .eq('is_deleted', False)
+    if file_id:
+        query = query.eq('id', file_id)
+    if user_id:
+        query = query.eq('user_id', user_id)
+    return query.execute().data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rehydrate Pinecone namespaces from the S3 vectors archive.")
+    parser.add_argument("--file-id", help="Restore a single file")
+    parser.add_argument("--user-id", help="Restore every ready file of a user")
+    parser.add_argument("--all", action="store_true", help="Restore every ready file")
+    parser.add_argument("--namespace", help="Target namespace (single file only)")
+    parser.add_argument("--index", help="Target Pinecone index, defaults to PINECONE_INDEX")
+    args = parser.parse_args()
+
+    if not (args.file_id or args.user_id or args.all):
+        parser.error("one of --file-id, --user-id or --all is required")
+
+    files = get_files_to_restore(args.file_id, args.user_id)
+    if args.namespace:
+        if len(files) != 1:
+            parser.error("--namespace requires exactly one file")
+        restored = {files[0]['id']: restore_file(files[0], args.namespace, args.index)}
+    else:
+        restored = restore_files(files, args.index)
+
+    for file_id, count in restored.items():
+        print(f"{file_id}: {count if count >= 0 else 'FAILED'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# Built-in libraries
+import os
+import concurrent.futures
+from datetime import datetime
+from types import SimpleNamespace
+
+# 3rd part libraries
+from rq import Queue
+from langchain.chat_models import ChatOpenAI
+from langchain.callbacks import get_openai_callback
+
+# Local libraries
+from maia.src.message import Message
+from maia.src.prompt_templates import template_summary_map_br, template_summary_reduce_br
+from maia.src.rate_limiter import RateLimiter, PRIORITY_BULK
+from maia.src.custom_logging import log_function_execution, logger
+from maia.engines.query import new_llm_response, MODEL_NAME_4K, TEMPERATURE
+from maia.engines.restore import iter_archived_vectors
+from maia.engines.embeddings import count_tokens
+from maia.database.supabase import SupabaseClient
+from maia.database.redis import Redis
+
+supabase_client = SupabaseClient.get_instance()
+
+SUMMARY_QUESTION = "Resuma o documento e sugira de em formato de lista 3 perguntas que poderiam ser feitas a esse documento."
+# The files worker already consumes this queue for embed and transcribe jobs
+SUMMARY_QUEUE = "files_worker"
+SUMMARY_JOB_TIMEOUT = 600
+SUMMARY_CHAIN_TYPE = "map_reduce"
+SUMMARY_MODEL = MODEL_NAME_4K
+# Chunk text per map call, sized to leave room for the prompt and SUMMARY_MAP_MAX_TOKENS in a 4K context
+SUMMARY_GROUP_TOKENS = 2800
+SUMMARY_MAP_MAX_TOKENS = 400
+SUMMARY_REDUCE_MAX_TOKENS = 700
+SUMMARY_MAP_WORKERS = int(os.getenv("SUMMARY_MAP_WORKERS", 8))
+
+
+def complete(prompt: str, max_tokens: int, model_name: str = SUMMARY_MODEL) -> tuple[str, SimpleNamespace]:
+    """
+    Runs one chat completion under the bulk rate limit budget.
+
+    Returns:
+        tuple: The completion text and its token usage and cost.
+    """
+    llm = ChatOpenAI(model_name=model_name, temperature=TEMPERATURE, max_tokens=max_tokens)
+    RateLimiter.get_instance().acquire('chat', count_tokens(prompt) + max_tokens, PRIORITY_BULK)
+    with get_openai_callback() as cb:
+        text = llm.predict(prompt)
+    return text, SimpleNamespace(total_tokens=cb.total_tokens, prompt_tokens=cb.prompt_tokens,
+                                 completion_tokens=cb.completion_tokens, total_cost=cb.total_cost)
+
+
+def group_texts(texts: list[str], max_tokens: int = SUMMARY_GROUP_TOKENS) -> list[str]:
+    # Consecutive texts joined up to max_tokens, so each group reads as one passage
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
+
+
+def add_usage(total: SimpleNamespace, usage: SimpleNamespace) -> None:
+    total.total_tokens += usage.total_tokens
+    total.prompt_tokens += usage.prompt_tokens
+    total.completion_tokens += usage.completion_tokens
+    total.total_cost += usage.total_cost
+
+
+@log_function_execution
+def map_summaries(groups: list[str], usage: SimpleNamespace) -> list[str]:
+    """
+    Summarizes groups in parallel, keeping their order.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SUMMARY_MAP_WORKERS) as executor:
+        results = list(executor.map(lambda group: complete(template_summary_map_br.format(text=group),
+                                                           SUMMARY_MAP_MAX_TOKENS), groups))
+    for _, group_usage in results:
+        add_usage(usage, group_usage)
+    return [text for text, _ in results]
+
+
+@log_function_execution
+def summarize_chunks(texts: list[str]) -> dict:
+    """
+    Map-reduce summary of a whole document.
+
+    1. Chunks are joined into groups of SUMMARY_GROUP_TOKENS and summarized in parallel
+    2. While the partial summaries do not fit in one group, they are grouped and summarized again
+    3. A last call writes the document summary and 3 suggested questions
+
+    Every chunk is read once; each reduce level shrinks the text about
+    SUMMARY_GROUP_TOKENS / SUMMARY_MAP_MAX_TOKENS times, so long documents only add levels.
+
+    Returns:
+        dict: A response shaped like `query`'s, with the usage of every call.
+    """
+    response = new_llm_response(SUMMARY_MODEL, {})
+    response.update({
+        'chain_type': SUMMARY_CHAIN_TYPE,
+        'prompt_template': template_summary_reduce_br,
+    })
+    usage = SimpleNamespace(total_tokens=0, prompt_tokens=0, completion_tokens=0, total_cost=0)
+
+    try:
+        groups = group_texts(texts)
+        while len(groups) > 1:
+            groups = group_texts(map_summaries(groups, usage))
+        if not groups:
+            raise ValueError("summarize_chunks: document has no text")
+
+        summary, reduce_usage = complete(template_summary_reduce_br.format(text=groups[0]), SUMMARY_REDUCE_MAX_TOKENS)
+        add_usage(usage, reduce_usage)
+        response['output_message'] = summary
+    except Exception as error:
+        logger.error(f"summarize_chunks: failed to summarize ERROR: {error}")
+        response.update({
+            'error': True,
+            'error_code': getattr(error, 'code', None),
+            'error_message': error
+        })
+
+    response['openai_callback'] = usage
+    return response
+
+
+@log_function_execution
+def summarize_file(user_id: str, file: dict) -> None:
+    """
+    Startup summary job: summarizes a ready file from its vectors archive, then
+    writes the summary to its chat and stores it on the file for deduplicated copies.
+    """
+    # Only the chunk texts are kept, in document order
+    chunks = [vector['metadata'] for vector in iter_archived_vectors(file['s3_vectors_key'])]
+    chunks.sort(key=lambda metadata: metadata.get('page_number') or 0)
+    llm_response = summarize_chunks([metadata.get('text', '') for metadata in chunks])
+
+    if llm_response['error']:
+        Message().save_message_metadata(user_id, file['chat_id'], SUMMARY_QUESTION, llm_response, "system", "error")
+        logger.error(f"summarize_file: failed to write startup message for file {file['id']}")
+        return
+
+    Message().write_to_chat(llm_response['output_message'], "assistant", file['chat_id'])
+    Message().save_message_metadata(user_id, file['chat_id'], SUMMARY_QUESTION, llm_response)
+    supabase_client.table('files') \
+                   .update({'summary': llm_response['output_message'],
+                            'updated_at': datetime.now().isoformat()}) \
+                   .eq('id', file['id']) \
+                   .execute()
+
+
+@log_function_execution
+def enqueue_summary(user_id: str, file: dict) -> None:
+    """
+    Queues the startup summary of a ready file, running it inline when the queue is unreachable.
+    Failures are only logged: the file stays ready without its startup message.
+    """
+    try:
+        queue = Queue(SUMMARY_QUEUE, connection=Redis().create_connection())
+        queue.enqueue(summarize_file, user_id, file, job_timeout=SUMMARY_JOB_TIMEOUT)
+        return
+    except Exception as error:
+        logger.warn(f"enqueue_summary: summary queue unavailable, summarizing inline: {error}")
+
+    try:
+        summarize_file(user_id, file)
+    except Exception as error:
+        logger.error(f"enqueue_summary: failed to summarize file {file['id']} ERROR: {error}")
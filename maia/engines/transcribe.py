@@ -7,9 +7,10 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 
 # Local libraries
-from maia.engines.embed import embed
+from maia.engines.embed import embed, find_ready_file_by_content_hash, clone_embedded_file
 from maia.src.utils import Utils
 from maia.src.user import User
+from maia.src.rate_limiter import RateLimiter, PRIORITY_BULK
 from maia.src.custom_logging import log_function_execution, logger
 from maia.database.supabase import SupabaseClient
 
@@ -18,6 +19,9 @@ supabase_client = SupabaseClient()
 @log_function_execution
 def transcribe_audio_bytes_like(audio_file_bytes: bytes) -> str:
     
+    # Wait for the shared Whisper budget
+    RateLimiter.get_instance().acquire('audio', priority=PRIORITY_BULK)
+    
     # Get file-like opened as binary
     response = openai.Audio.transcribe("whisper-1", audio_file_bytes)
     
@@ -56,6 +60,14 @@ def transcribe(user_id: str, file: dict) -> None:
     tmp_raw_file_path = Utils().write_raw_file_bytes_to_fs(file['original_name'], downloaded_file_bytes)
     supabase_client.update('files',  file['id'], {'status': 'Transcrevendo', 'updated_at': datetime.now().isoformat()})
     
+    # Reuse the transcript and vectors of an identical audio file
+    content_hash = Utils().hash_file(tmp_raw_file_path)
+    source_file = find_ready_file_by_content_hash(content_hash, file['id'])
+    if source_file and clone_embedded_file(user_id, file, source_file, content_hash):
+        Utils().delete_local_file(tmp_raw_file_path)
+        User().increment_user_monthly_audio_seconds(user_id, file['audio_seconds'])
+        return
+    
     # Load file in binary format to memory
     loaded_file = open(tmp_raw_file_path, "rb")
     
@@ -69,6 +81,6 @@ def transcribe(user_id: str, file: dict) -> None:
     # Create PDF
     temp_pdf_file_path = create_pdf(transcription)
 
-    embed(user_id, file, temp_pdf_file_path)
+    embed(user_id, file, temp_pdf_file_path, content_hash)
     
         
\ No newline at end of file
@@ -0,0 +1,127 @@
+# Built-in libraries
+import json
+import time
+import threading
+import concurrent.futures
+
+# Local libraries
+from maia.src.custom_logging import log_function_execution, logger
+from maia.database.pinecone import PineconeClient
+
+# Pinecone rejects requests above 2MB, keep some headroom for the envelope
+UPSERT_MAX_BATCH_BYTES = 1800 * 1024
+UPSERT_MAX_BATCH_VECTORS = 100
+UPSERT_WORKERS = 8
+UPSERT_MAX_PENDING_BATCHES = 16
+UPSERT_MAX_RETRIES = 5
+
+
+def estimate_vector_bytes(vector: dict) -> int:
+    # Floats are serialized as ~20 chars each in the JSON request body
+    return len(vector['id']) + 20 * len(vector['values']) + len(json.dumps(vector.get('metadata', {})))
+
+
+class ConcurrentUpserter(object):
+    """
+    Upserts vectors to Pinecone from a thread pool.
+
+    Vectors can be added incrementally; they are packed into batches bounded by
+    UPSERT_MAX_BATCH_VECTORS and UPSERT_MAX_BATCH_BYTES. `add` blocks once
+    UPSERT_MAX_PENDING_BATCHES are in flight, and each batch is retried on its own.
+
+    Usage:
+        with ConcurrentUpserter(namespace) as upserter:
+            upserter.add(vectors)
+    """
+    def __init__(self, namespace: str, index=None,
+                 workers: int = UPSERT_WORKERS,
+                 max_pending_batches: int = UPSERT_MAX_PENDING_BATCHES) -> None:
+        self.namespace = namespace
+        self.index = index or PineconeClient.get_instance()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_pending_batches)
+        self.lock = threading.Lock()
+        self.batch = []
+        self.batch_bytes = 0
+        self.upserted_count = 0
+        self.errors = []
+
+    def add(self, vectors: list[dict]) -> None:
+        for vector in vectors:
+            vector_bytes = estimate_vector_bytes(vector)
+            if self.batch and (len(self.batch) >= UPSERT_MAX_BATCH_VECTORS
+                               or self.batch_bytes + vector_bytes > UPSERT_MAX_BATCH_BYTES):
+                self.flush()
+            self.batch.append(vector)
+            self.batch_bytes += vector_bytes
+
+    def flush(self) -> None:
+        if not self.batch:
+            return
+        batch = self.batch
+        self.batch = []
+        self.batch_bytes = 0
+
+        # Back-pressure: wait for a free slot before queueing another batch
+        self.slots.acquire()
+        future = self.executor.submit(self._upsert_batch, batch)
+        future.add_done_callback(self._on_batch_done)
+
+    def _upsert_batch(self, batch: list[dict]) -> int:
+        for attempt in range(UPSERT_MAX_RETRIES):
+            try:
+                self.index.upsert(vectors=batch, namespace=self.namespace)
+                return len(batch)
+            except Exception as error:
+                if attempt == UPSERT_MAX_RETRIES - 1:
+                    raise
+                wait_seconds = 2 ** attempt
+                logger.warn(f"ConcurrentUpserter: {error}. Retry {attempt + 1} of {UPSERT_MAX_RETRIES} in {wait_seconds}s")
+                time.sleep(wait_seconds)
+
+    def _on_batch_done(self, future: concurrent.futures.Future) -> None:
+        self.slots.release()
+        with self.lock:
+            try:
+                self.upserted_count += future.result()
+            except Exception as error:
+                logger.error(f"ConcurrentUpserter: failed to upsert batch on namespace {self.namespace}: {error}")
+                self.errors.append(error)
+
+    def close(self) -> int:
+        """
+        Sends the last partial batch and waits for every batch to finish.
+
+        Returns:
+            int: The number of vectors upserted.
+
+        Raises:
+            Exception: The first batch error, once every batch has finished.
+        """
+        self.flush()
+        self.executor.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
+        return self.upserted_count
+
+    def __enter__(self) -> "ConcurrentUpserter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+@log_function_execution
+def upsert_vectors(vectors: list[dict], namespace: str, index=None) -> int:
+    """
+    Upserts a list of vectors concurrently.
+
+    Returns:
+        int: The number of vectors upserted.
+    """
+    upserter = ConcurrentUpserter(namespace, index=index)
+    upserter.add(vectors)
+    return upserter.close()
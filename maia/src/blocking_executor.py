@@ -0,0 +1,31 @@
+# Built-in libraries
+import os
+import asyncio
+import threading
+import functools
+import concurrent.futures
+from typing import Any, Callable
+
+# Sized to the in-flight `aquery` calls, so short blocking calls (Supabase, Redis,
+# Pinecone) of async requests never queue behind asyncio's small default executor
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", os.getenv("QUERY_MAX_CONCURRENCY", 200)))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_blocking_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_WORKERS,
+                                                              thread_name_prefix="maia_blocking")
+        return _executor
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """
+    Awaits a blocking call run on the dedicated executor.
+    """
+    return await asyncio.get_running_loop().run_in_executor(get_blocking_executor(),
+                                                            functools.partial(func, *args, **kwargs))
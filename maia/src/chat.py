@@ -1,13 +1,15 @@
 # Built-in libraries
 import os
-from threading import Thread
-from typing import Optional
+import time
+import asyncio
+from typing import Iterator, Optional
 from datetime import datetime
 
 # Local libraries
-from maia.engines.query import query
+from maia.engines.query import query, query_stream, aquery
 from maia.src.user import User
 from maia.src.message import Message
+from maia.src.blocking_executor import run_blocking
 from maia.src.custom_logging import log_function_execution, logger
 from maia.database.supabase import SupabaseClient
 
@@ -15,6 +17,16 @@ supabase_client = SupabaseClient.get_instance()
 
 SUB_PLAN_1_MAX_AI_INTERACTIONS = os.getenv("SUB_PLAN_1_MAX_AI_INTERACTIONS")
 
+# Columns returned when listing or opening chats; messages are read from chat_messages a page at a time
+CHAT_SUMMARY_COLUMNS = "id, name, file_id, user_id, namespace, status, is_archived, archived_at, created_at, updated_at, last_message_seq"
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", 50))
+
+# How often a streaming answer is saved to the chat while it is generated
+CHAT_STREAM_PERSIST_SECONDS = float(os.getenv("CHAT_STREAM_PERSIST_SECONDS", 1.0))
+
+ERROR_CHAT_MESSAGE = "Ocorreu um erro durante sua requisição, por favor contate o suporte através de: suporte@ninev.co!"
+MAX_INTERACTIONS_MESSAGE = "Limite máximo de mensagens atingido! Por favor, faça um upgrade de plano ou mande um email para suporte@ninev.co."
+
 class Chat(object):
     def __init__(self, user_id: str, chat_id: str = None) -> None:
         self.supabase_client = supabase_client
@@ -31,35 +43,74 @@ class Chat(object):
             list[dict]: A list of chat dictionaries.
         """
         chats, _ = self.supabase_client.table('chats') \
-                                       .select('*') \
+                                       .select(CHAT_SUMMARY_COLUMNS) \
                                        .eq('user_id', self.user_id) \
                                        .eq('is_archived', is_archived) \
                                        .execute()
         return chats[1]
     
     @log_function_execution
-    def get_one(self, is_archived: bool = False) -> Optional[dict | None]:
+    def get_one(self, is_archived: bool = False, limit: int = CHAT_HISTORY_PAGE_SIZE) -> Optional[dict | None]:
         """
         Fetches a chat by its ID and returns it as a Chat object.
         
         Args:
             is_archived bool: If Chat is Archived ot not
+            limit int: How many of the latest messages to include
             
         Returns
-            [{}]: List with dict chat content
+            {}: The chat summary with its latest `messages` and the `before_seq`
+                cursor to load older ones (None when there are none)
             None: For no Chat ID found
         
         """
         chat, _ = self.supabase_client.table('chats') \
-                                      .select('*') \
+                                      .select(CHAT_SUMMARY_COLUMNS) \
                                       .eq('id', self.chat_id) \
                                       .eq('user_id', self.user_id) \
                                       .eq('is_archived', is_archived) \
                                       .execute()
 
         if chat[1]:
-            return chat[1][0]
+            chat = chat[1][0]
+            chat.update(self._get_messages_page(limit))
+            return chat
+        return None
+
+    @log_function_execution
+    def get_messages(self, before_seq: int = None, limit: int = CHAT_HISTORY_PAGE_SIZE) -> Optional[dict | None]:
+        """
+        Loads a page of chat history, latest first, going back with the cursor.
+
+        Args:
+            before_seq int: The `before_seq` of the previous page, None for the latest messages
+            limit int: The page size
+
+        Returns
+            {}: The page `messages`, oldest first, and the `before_seq` cursor of the
+                next older page (None when there is none)
+            None: For no Chat ID found
+        """
+        chat, _ = self.supabase_client.table('chats') \
+                                      .select('id') \
+                                      .eq('id', self.chat_id) \
+                                      .eq('user_id', self.user_id) \
+                                      .execute()
+
+        if chat[1]:
+            return self._get_messages_page(limit, before_seq)
         return None
+
+    def _get_messages_page(self, limit: int, before_seq: int = None) -> dict:
+        limit = max(limit, 1)
+        # One extra message tells whether there is an older page
+        messages = Message().get_chat_messages(self.chat_id, limit + 1, before_seq)
+        has_older = len(messages) > limit
+        messages = messages[1:] if has_older else messages
+        return {
+            'messages': messages,
+            'before_seq': messages[0]['seq'] if has_older else None,
+        }
     
     @log_function_execution
     def create(self, file_id: str) -> dict:
@@ -127,8 +178,8 @@ class Chat(object):
     @log_function_execution
     def send_message(self, user: dict, content: str, role: str) -> None:
         
-        # Write incoming message
-        Thread(target=Message().write_to_chat, args=(content, role, self.chat_id)).start()
+        # Write incoming message, before the answer so it gets the lower seq
+        Message().write_to_chat(content, role, self.chat_id)
         
         # Validate user limits
         is_limit_reached = self.has_user_reached_max_interactions(user)
@@ -140,14 +191,13 @@ class Chat(object):
     @log_function_execution
     def _handle_max_interactions(self):
         # Write the system message for max interactions
-        max_message_warn = "Limite máximo de mensagens atingido! Por favor, faça um upgrade de plano ou mande um email para suporte@ninev.co."
-        Message().write_to_chat(max_message_warn, "system", self.chat_id)
+        Message().write_to_chat(MAX_INTERACTIONS_MESSAGE, "system", self.chat_id)
 
     @log_function_execution
     def process_incoming_message(self, input_message: str) -> None:
         
         # Set default error message
-        error_chat_message = "Ocorreu um erro durante sua requisição, por favor contate o suporte através de: suporte@ninev.co!"
+        error_chat_message = ERROR_CHAT_MESSAGE
         
         # Set handlers
         message_writer = Message()
@@ -171,4 +221,106 @@ class Chat(object):
         
             user_handler.increment_user_current_ai_interactions(self.user_id)
             user_handler.increment_user_monthly_ai_interactions(self.user_id)
-            
+
+    @log_function_execution
+    def send_message_stream(self, user: dict, content: str, role: str) -> Iterator[str]:
+        """
+        Same as `send_message`, yielding the answer as it is generated.
+
+        Yields:
+            str: Answer tokens, or the system message shown instead of an answer.
+        """
+        # Written before the answer placeholder, so both land in the chat in order
+        Message().write_to_chat(content, role, self.chat_id)
+
+        if self.has_user_reached_max_interactions(user):
+            self._handle_max_interactions()
+            yield MAX_INTERACTIONS_MESSAGE
+        else:
+            yield from self.process_incoming_message_stream(content)
+
+    @log_function_execution
+    def process_incoming_message_stream(self, input_message: str) -> Iterator[str]:
+        """
+        Streams the answer to a message, saving the partial answer to the chat
+        every CHAT_STREAM_PERSIST_SECONDS so other readers see it grow.
+        """
+        message_writer = Message()
+        user_handler = User()
+        namespace = f"{self.user_id}.{self.chat_id}"
+
+        answer = message_writer.write_to_chat("", "assistant", self.chat_id)
+        if answer is None:
+            return
+
+        content = ""
+        llm_response = None
+        persisted_at = time.monotonic()
+        try:
+            for event in query_stream(namespace, input_message):
+                if 'response' in event:
+                    llm_response = event['response']
+                    continue
+                content += event['token']
+                yield event['token']
+                if time.monotonic() - persisted_at >= CHAT_STREAM_PERSIST_SECONDS:
+                    message_writer.update_chat_message(self.chat_id, answer['id'], content)
+                    persisted_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"query_stream: Unexpected error: {e}")
+
+        if llm_response is None or llm_response['error']:
+            message_writer.update_chat_message(self.chat_id, answer['id'], ERROR_CHAT_MESSAGE, "system")
+            if llm_response is not None:
+                message_writer.save_message_metadata(self.user_id, self.chat_id, input_message, llm_response, "system", "error")
+            yield ERROR_CHAT_MESSAGE
+        else:
+            message_writer.update_chat_message(self.chat_id, answer['id'], llm_response['output_message'])
+            message_writer.save_message_metadata(self.user_id, self.chat_id, input_message, llm_response)
+
+            user_handler.increment_user_current_ai_interactions(self.user_id)
+            user_handler.increment_user_monthly_ai_interactions(self.user_id)
+
+    @log_function_execution
+    async def asend_message(self, user: dict, content: str, role: str) -> None:
+        """
+        Async `send_message`. Supabase calls run in threads while the answer is
+        awaited, so a single event loop can serve many chats at once.
+        """
+        # The incoming message is stored before the answer, so it gets the lower seq
+        _, is_limit_reached = await asyncio.gather(
+            run_blocking(Message().write_to_chat, content, role, self.chat_id),
+            run_blocking(self.has_user_reached_max_interactions, user))
+
+        if is_limit_reached:
+            await run_blocking(self._handle_max_interactions)
+        else:
+            await self.aprocess_incoming_message(content)
+
+    @log_function_execution
+    async def aprocess_incoming_message(self, input_message: str) -> None:
+        message_writer = Message()
+        user_handler = User()
+        namespace = f"{self.user_id}.{self.chat_id}"
+
+        try:
+            llm_response = await aquery(namespace, input_message)
+        except asyncio.CancelledError:
+            logger.warn(f"aquery: {namespace}: request cancelled, answer dropped")
+            raise
+        except Exception as e:
+            logger.error(f"aquery: Unexpected error: {e}")
+            await run_blocking(message_writer.write_to_chat, ERROR_CHAT_MESSAGE, "system", self.chat_id)
+            return
+
+        if llm_response['error']:
+            await run_blocking(message_writer.write_to_chat, ERROR_CHAT_MESSAGE, "system", self.chat_id)
+            await run_blocking(message_writer.save_message_metadata, self.user_id, self.chat_id,
+                                    input_message, llm_response, "system", "error")
+        else:
+            await run_blocking(message_writer.write_to_chat, llm_response['output_message'], "assistant", self.chat_id)
+            await asyncio.gather(
+                run_blocking(message_writer.save_message_metadata, self.user_id, self.chat_id,
+                                  input_message, llm_response),
+                run_blocking(user_handler.increment_user_current_ai_interactions, self.user_id),
+                run_blocking(user_handler.increment_user_monthly_ai_interactions, self.user_id))
@@ -13,6 +13,8 @@ from maia.src.user import User
 from maia.src.chat import Chat
 from maia.engines.embed import embed
 from maia.engines.transcribe import transcribe
+from maia.engines.embeddings import get_file_embedding_backend
+from maia.engines.query import invalidate_namespace_caches
 from maia.src.custom_logging import log_function_execution, logger
 from maia.src.utils import Utils
 from maia.database.supabase import SupabaseClient
@@ -64,7 +66,7 @@ class File(object):
                 s3_raw_file_key = f"user_id={self.user_id}/file={file_id}/{file_name}"
             
             # Set S3 vector paths
-            s3_vectors_key = f"user_id={self.user_id}/file={file_id}/vectors.json.gz"
+            s3_vectors_key = f"user_id={self.user_id}/file={file_id}/vectors.maiavec"
         
             # Get extension
             file = {}
@@ -180,7 +182,9 @@ class File(object):
             chat = response[1][0]
 
         # Delete vectors from db
-        pinecone_client.delete(delete_all=True, namespace=chat['namespace'])
+        vectors_index = PineconeClient.get_index(get_file_embedding_backend(file).index_name)
+        vectors_index.delete(delete_all=True, namespace=chat['namespace'])
+        invalidate_namespace_caches(chat['namespace'])
         
         # Delete AWS raw and vectors objects
         Utils().delete_aws_file(file['s3_raw_file_key'])
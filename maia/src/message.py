@@ -6,48 +6,93 @@ from maia.database.supabase import SupabaseClient
 
 supabase_client = SupabaseClient.get_instance()
 
+def to_chat_message(row: dict) -> dict:
+    # chat_messages rows, shaped like the former chats.messages items
+    return {
+        'id': row['id'],
+        '_id': str(row['seq']),
+        'seq': row['seq'],
+        'role': row['role'],
+        'content': row['content'],
+        'created_at': row['created_at'],
+    }
+
 class Message(object):
     @log_function_execution    
     def write_to_chat(self, content: str, role: str, chat_id: str) -> dict:
         """
         Store a receiving message inside the Chat.
 
+        Messages are appended to `chat_messages` with the chat's next `seq`, so a
+        write costs the same however long the chat is and concurrent writes
+        never overwrite each other.
+
         Args:
             content (str): The message content itself
             role (str): The message role sender
             chat_id (str): The Chat ID reference
 
         Returns:
-            dict: The new created message
+            dict: The new created message, None when the Chat ID does not exist
         """
-        # Retrieve current messages
-        response = supabase_client.table('chats').select('messages').eq('id', chat_id).execute()
-        
-        if response.data:
-            current_messages = response.data[0]['messages'] or []
-        else:
-            # Chat ID does not exists
-            return None       
-        
-        # Build message body
-        message = {}
-        message['id'] = str(uuid4())
-        message['_id'] = str(len(current_messages) +1)
-        message['role'] = role
-        message['content'] = content
-        message['created_at'] = datetime.now().isoformat()
-
-        # Append new message to current messages
-        current_messages.append(message)
-
-        # Update messages
-        supabase_client.table('chats') \
-                    .update({'messages': current_messages,
-                             'updated_at': datetime.now().isoformat()}) \
-                    .eq('id', chat_id) \
-                    .execute()    
-
-        return message   
+        response = supabase_client.rpc(
+                                    "append_chat_message",
+                                    {"p_chat_id": chat_id, "p_role": role, "p_content": content}
+                                ).execute()
+
+        return response.data or None
+
+    @log_function_execution
+    def update_chat_message(self, chat_id: str, message_id: str, content: str, role: str = None) -> dict:
+        """
+        Replaces the content (and optionally the role) of a message already in the Chat.
+
+        Args:
+            chat_id (str): The Chat ID reference
+            message_id (str): The `id` returned by `write_to_chat`
+            content (str): The new message content
+            role (str): The new message role, kept when None
+
+        Returns:
+            dict: The updated message, None when it does not exist
+        """
+        update = {'content': content, 'updated_at': datetime.now().isoformat()}
+        if role:
+            update['role'] = role
+
+        response = supabase_client.table('chat_messages') \
+                                  .update(update) \
+                                  .eq('id', message_id) \
+                                  .eq('chat_id', chat_id) \
+                                  .execute()
+
+        return to_chat_message(response.data[0]) if response.data else None
+
+    @log_function_execution
+    def get_chat_messages(self, chat_id: str, limit: int = None, before_seq: int = None) -> list[dict]:
+        """
+        Returns messages of a Chat in the order they were written.
+
+        Args:
+            chat_id (str): The Chat ID reference
+            limit (int): Only the latest `limit` messages, all of them when None
+            before_seq (int): Only messages older than this `seq`, the cursor to load older pages
+
+        Returns:
+            list[dict]: The messages, oldest first
+        """
+        request = supabase_client.table('chat_messages') \
+                                 .select('id, seq, role, content, created_at') \
+                                 .eq('chat_id', chat_id)
+        if before_seq is not None:
+            request = request.lt('seq', before_seq)
+        if limit is None:
+            response = request.order('seq').execute()
+            return [to_chat_message(row) for row in response.data]
+
+        # Latest first, so the page is read off the (chat_id, seq) index
+        response = request.order('seq', desc=True).limit(limit).execute()
+        return [to_chat_message(row) for row in reversed(response.data)]
 
     @log_function_execution
     def save_message_metadata(self,
@@ -65,6 +110,8 @@ class Message(object):
         usd_cost = getattr(openai_callback, 'total_cost', 0)
         error_code = llm_response.get('error_code', None)
         error_message = llm_response.get('error_message', None)
+        routing = llm_response.get('routing') or {}
+        answer_cache = llm_response.get('answer_cache') or {}
         
         message = {
             "id": str(uuid4()),
@@ -87,7 +134,13 @@ class Message(object):
             "temperature": str(llm_response['temperature']),
             "status": status,
             "error_code": error_code,
-            "error_message": error_message
+            "error_message": error_message,
+            "estimated_prompt_tokens": routing.get('estimated_prompt_tokens'),
+            "context_chunks": routing.get('context_chunks'),
+            "trimmed_chunks": routing.get('trimmed_chunks'),
+            "answer_cache_hit": answer_cache.get('hit', False),
+            "answer_cache_similarity": answer_cache.get('similarity'),
+            "coalesced": llm_response.get('coalesced', False)
         }
 
         supabase_client.table('messages').insert(message).execute()   
\ No newline at end of file
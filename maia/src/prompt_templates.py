@@ -103,4 +103,22 @@ template_en_0 = """
                 {context}
                 
                 Question: {question}
-                """
\ No newline at end of file
+                """
+template_summary_map_br = """
+                Você é MAIA, uma assistente de IA especializada em análise documental.
+
+                Resuma o trecho de documento a seguir em português, em até 10 frases,
+                preservando nomes, datas, valores e obrigações mencionados.
+
+                Trecho: {text}
+                """
+
+template_summary_reduce_br = """
+                Você é MAIA, uma assistente de IA especializada em análise documental.
+
+                A seguir estão resumos de partes consecutivas de um mesmo documento.
+                Escreva em português um resumo único do documento e sugira, em formato de lista,
+                3 perguntas que poderiam ser feitas a esse documento.
+
+                Resumos: {text}
+                """
@@ -0,0 +1,292 @@
+# Built-in libraries
+import os
+import time
+import asyncio
+import weakref
+from uuid import uuid4
+
+# Local libraries
+from maia.src.custom_logging import log_function_execution, logger
+from maia.database.redis import Redis
+
+RATE_LIMIT_PREFIX = "maia:rate_limit"
+
+# Requests and tokens per minute, per OpenAI resource, shared by every worker
+RATE_LIMIT_BUDGETS = {
+    'embeddings': {
+        'rpm': int(os.getenv("OPENAI_EMBEDDINGS_RPM", 3000)),
+        'tpm': int(os.getenv("OPENAI_EMBEDDINGS_TPM", 1000000)),
+    },
+    'chat': {
+        'rpm': int(os.getenv("OPENAI_CHAT_RPM", 3500)),
+        'tpm': int(os.getenv("OPENAI_CHAT_TPM", 90000)),
+    },
+    'audio': {
+        'rpm': int(os.getenv("OPENAI_AUDIO_RPM", 50)),
+        'tpm': 0,
+    },
+}
+
+# Share of every budget that bulk work cannot use, kept for interactive requests
+RATE_LIMIT_BULK_RESERVE = float(os.getenv("RATE_LIMIT_BULK_RESERVE", 0.2))
+RATE_LIMIT_MAX_WAIT_SECONDS = {'interactive': 30, 'bulk': 600}
+RATE_LIMIT_WAITER_TTL_SECONDS = 30
+# Every OpenAI call goes through Redis first, so an unreachable Redis must fail fast
+RATE_LIMIT_REDIS_TIMEOUT_SECONDS = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT_SECONDS", 1.0))
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+
+# Returns the seconds to wait before retrying, "0" when the request was admitted
+TOKEN_BUCKET_SCRIPT = """
+local bucket_key = KEYS[1]
+local waiters_key = KEYS[2]
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local interactive = ARGV[4] == 'interactive'
+local reserve = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local state = redis.call('HMGET', bucket_key, 'requests', 'tokens', 'updated_at')
+local requests = tonumber(state[1]) or rpm
+local tokens = tonumber(state[2]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60)
+
+local floor_requests = 0
+local floor_tokens = 0
+local wait = 0
+if not interactive then
+    floor_requests = rpm * reserve
+    floor_tokens = tpm * reserve
+    redis.call('ZREMRANGEBYSCORE', waiters_key, '-inf', now - tonumber(ARGV[6]))
+    if redis.call('ZCARD', waiters_key) > 0 then
+        wait = 0.05
+    end
+end
+
+if requests - 1 < floor_requests then
+    wait = math.max(wait, (floor_requests + 1 - requests) * 60 / rpm)
+end
+if tpm > 0 and tokens - cost < floor_tokens then
+    wait = math.max(wait, (floor_tokens + cost - tokens) * 60 / tpm)
+end
+
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+
+redis.call('HSET', bucket_key, 'requests', requests, 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', bucket_key, 120)
+return tostring(wait)
+"""
+
+
+class RateLimiter(object):
+    """
+    Token-bucket scheduler for OpenAI calls, shared by every process through Redis.
+
+    Each resource has its own requests and tokens per minute budget. Interactive
+    requests may use the whole budget and, while any is waiting, bulk requests
+    hold back; bulk requests never dip into the RATE_LIMIT_BULK_RESERVE share.
+    When Redis is unavailable requests are admitted immediately.
+
+    `aacquire` is the same scheduler for the event loop: it talks to Redis with
+    an async client and waits with asyncio.sleep.
+    """
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self) -> None:
+        self.connection = None
+        self.script = None
+        # Async clients are bound to their event loop, so each loop gets its own
+        self.async_scripts = weakref.WeakKeyDictionary()
+        try:
+            self.connection = Redis().create_connection(socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT_SECONDS,
+                                                        socket_timeout=RATE_LIMIT_REDIS_TIMEOUT_SECONDS)
+            self.connection.ping()
+            self.script = self.connection.register_script(TOKEN_BUCKET_SCRIPT)
+        except Exception as error:
+            self.connection = None
+            self.script = None
+            logger.warn(f"RateLimiter: Redis unavailable, rate limiting disabled: {error}")
+
+    def _key(self, resource: str, name: str) -> str:
+        return f"{RATE_LIMIT_PREFIX}:{resource}:{name}"
+
+    def _get_async_script(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self.async_scripts:
+            connection = Redis().create_async_connection(socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT_SECONDS,
+                                                         socket_timeout=RATE_LIMIT_REDIS_TIMEOUT_SECONDS)
+            self.async_scripts[loop] = (connection, connection.register_script(TOKEN_BUCKET_SCRIPT))
+        return self.async_scripts[loop]
+
+    def _script_args(self, resource: str, cost: int, priority: str) -> list:
+        budget = RATE_LIMIT_BUDGETS[resource]
+        return [budget['rpm'], budget['tpm'], cost, priority, RATE_LIMIT_BULK_RESERVE, RATE_LIMIT_WAITER_TTL_SECONDS]
+
+    def _clamp_cost(self, resource: str, tokens: int, priority: str) -> int:
+        # A request larger than the usable budget would never be admitted
+        tpm = RATE_LIMIT_BUDGETS[resource]['tpm']
+        usable = tpm if priority == PRIORITY_INTERACTIVE else tpm * (1 - RATE_LIMIT_BULK_RESERVE)
+        return min(tokens, int(usable))
+
+    @log_function_execution
+    def acquire(self, resource: str, tokens: int = 0, priority: str = PRIORITY_BULK) -> float:
+        """
+        Blocks until the resource budget admits one request of `tokens` tokens.
+
+        Args:
+            resource (str): One of RATE_LIMIT_BUDGETS keys.
+            tokens (int): Estimated tokens consumed by the request.
+            priority (str): "interactive" for chat queries, "bulk" for ingestion.
+
+        Returns:
+            float: The seconds spent queueing.
+        """
+        if self.script is None:
+            return 0.0
+
+        cost = self._clamp_cost(resource, tokens, priority)
+        waiters_key = self._key(resource, "interactive_waiters")
+        waiter_id = str(uuid4())
+        started_at = time.monotonic()
+
+        try:
+            while True:
+                if priority == PRIORITY_INTERACTIVE:
+                    self.connection.zadd(waiters_key, {waiter_id: time.time()})
+                wait = float(self.script(keys=[self._key(resource, "bucket"), waiters_key],
+                                         args=self._script_args(resource, cost, priority)))
+                if wait == 0:
+                    break
+                if time.monotonic() - started_at + wait > RATE_LIMIT_MAX_WAIT_SECONDS[priority]:
+                    logger.warn(f"RateLimiter: {resource} {priority} request waited too long, admitting it anyway")
+                    break
+                time.sleep(wait)
+        except Exception as error:
+            logger.error(f"RateLimiter.acquire ERROR: {error}")
+        finally:
+            if priority == PRIORITY_INTERACTIVE:
+                self._safe_call(self.connection.zrem, waiters_key, waiter_id)
+
+        waited = time.monotonic() - started_at
+        self._record(resource, priority, waited)
+        return waited
+
+    @log_function_execution
+    async def aacquire(self, resource: str, tokens: int = 0, priority: str = PRIORITY_BULK) -> float:
+        """
+        Async `acquire`: waits for the budget without blocking the event loop.
+
+        Returns:
+            float: The seconds spent queueing.
+        """
+        if self.script is None:
+            return 0.0
+
+        cost = self._clamp_cost(resource, tokens, priority)
+        waiters_key = self._key(resource, "interactive_waiters")
+        waiter_id = str(uuid4())
+        started_at = time.monotonic()
+        connection = None
+
+        try:
+            connection, script = self._get_async_script()
+            while True:
+                if priority == PRIORITY_INTERACTIVE:
+                    await connection.zadd(waiters_key, {waiter_id: time.time()})
+                wait = float(await script(keys=[self._key(resource, "bucket"), waiters_key],
+                                          args=self._script_args(resource, cost, priority)))
+                if wait == 0:
+                    break
+                if time.monotonic() - started_at + wait > RATE_LIMIT_MAX_WAIT_SECONDS[priority]:
+                    logger.warn(f"RateLimiter: {resource} {priority} request waited too long, admitting it anyway")
+                    break
+                await asyncio.sleep(wait)
+        except Exception as error:
+            logger.error(f"RateLimiter.aacquire ERROR: {error}")
+        finally:
+            if priority == PRIORITY_INTERACTIVE and connection is not None:
+                try:
+                    await connection.zrem(waiters_key, waiter_id)
+                except Exception as error:
+                    logger.error(f"RateLimiter ERROR: {error}")
+
+        waited = time.monotonic() - started_at
+        if connection is not None:
+            await self._arecord(connection, resource, priority, waited)
+        return waited
+
+    def _safe_call(self, method, *args) -> None:
+        try:
+            method(*args)
+        except Exception as error:
+            logger.error(f"RateLimiter ERROR: {error}")
+
+    def _record(self, resource: str, priority: str, waited: float) -> None:
+        stats_key = self._key(resource, "stats")
+        try:
+            pipeline = self.connection.pipeline()
+            pipeline.hincrby(stats_key, f"{priority}_requests", 1)
+            pipeline.hincrbyfloat(stats_key, f"{priority}_wait_seconds", waited)
+            pipeline.execute()
+        except Exception as error:
+            logger.error(f"RateLimiter._record ERROR: {error}")
+
+    async def _arecord(self, connection, resource: str, priority: str, waited: float) -> None:
+        stats_key = self._key(resource, "stats")
+        try:
+            pipeline = connection.pipeline()
+            pipeline.hincrby(stats_key, f"{priority}_requests", 1)
+            pipeline.hincrbyfloat(stats_key, f"{priority}_wait_seconds", waited)
+            await pipeline.execute()
+        except Exception as error:
+            logger.error(f"RateLimiter._arecord ERROR: {error}")
+
+    @log_function_execution
+    def get_status(self, resource: str) -> dict:
+        """
+        Reports the current utilization and queueing delay of a resource.
+
+        Returns:
+            dict: Budget utilization (0..1), interactive requests waiting and
+                average queueing delay in seconds per priority.
+        """
+        budget = RATE_LIMIT_BUDGETS[resource]
+        if self.connection is None:
+            return {'resource': resource, 'enabled': False}
+
+        requests, tokens, updated_at = self.connection.hmget(self._key(resource, "bucket"),
+                                                             'requests', 'tokens', 'updated_at')
+        elapsed = max(0.0, time.time() - float(updated_at)) if updated_at else 0.0
+        available_requests = min(budget['rpm'], float(requests) + elapsed * budget['rpm'] / 60) \
+            if requests is not None else budget['rpm']
+        available_tokens = min(budget['tpm'], float(tokens) + elapsed * budget['tpm'] / 60) \
+            if tokens is not None else budget['tpm']
+        stats = {key.decode(): float(value)
+                 for key, value in self.connection.hgetall(self._key(resource, "stats")).items()}
+
+        status = {
+            'resource': resource,
+            'enabled': True,
+            'requests_utilization': 1 - available_requests / budget['rpm'],
+            'tokens_utilization': 1 - available_tokens / budget['tpm'] if budget['tpm'] else 0.0,
+            'interactive_waiting': self.connection.zcard(self._key(resource, "interactive_waiters")),
+        }
+        for priority in (PRIORITY_INTERACTIVE, PRIORITY_BULK):
+            count = stats.get(f"{priority}_requests", 0)
+            status[f"{priority}_avg_wait_seconds"] = stats.get(f"{priority}_wait_seconds", 0) / count if count else 0.0
+        return status
@@ -0,0 +1,68 @@
+# Built-in libraries
+import threading
+from typing import Any, Callable, Hashable
+
+
+class Flight(object):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Thread-safe coalescing of identical in-flight calls.
+
+    The first caller of a key runs the call; callers arriving with the same key
+    while it runs wait for it and share its result or exception. Nothing is kept
+    once the call returns, so results are never stale.
+    """
+    def __init__(self) -> None:
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        Runs `fn`, or waits for the call already running for `key`.
+
+        Returns:
+            tuple: The result and whether it was shared from another caller's call.
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            requests = self.calls + self.coalesced
+            return {
+                'in_flight': len(self.flights),
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'coalesced_rate': self.coalesced / requests if requests else 0.0,
+            }
@@ -1,5 +1,5 @@
 # Built-in modules
-import os, time, json, gzip, shutil, requests, asyncio, aiohttp, tempfile
+import os, time, json, gzip, shutil, hashlib, requests, asyncio, aiohttp, tempfile
 
 # Local libraries
 from maia.src.custom_logging import log_function_execution, logger
@@ -92,6 +92,23 @@ class Utils(object):
         except Exception as error:
             logger.error(f"API: SOURCES: FILE ({file_key}): failed to write file to s3 | Error: {error}")
                         
+    @log_function_execution
+    def copy_s3_file(self, source_file_key: str, file_key: str) -> None:
+        s3_client.copy_object(CopySource={'Bucket': AWS_S3_RAW_FILES_BUCKET, 'Key': source_file_key},
+                              Bucket=AWS_S3_RAW_FILES_BUCKET,
+                              Key=file_key)
+
+    @log_function_execution
+    def hash_file(self, file_path: str) -> str:
+        """
+        Computes the SHA-256 hex digest of a local file, reading it in 1MB chunks.
+        """
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f_in:
+            for chunk in iter(lambda: f_in.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
     @log_function_execution
     def compress_file(self, input_file_path: str, output_file_path: str) -> None:
         with open(input_file_path, 'rb') as f_in:
@@ -107,6 +124,14 @@ class Utils(object):
         # Compress the JSON data using gzip
         return gzip.compress(json_data.encode())
     
+    @log_function_execution
+    def open_s3_file(self, file_key: str):
+        """
+        Opens an S3 object as a streaming, file-like body without downloading it first.
+        """
+        response = s3_client.get_object(Bucket=AWS_S3_RAW_FILES_BUCKET, Key=file_key)
+        return response['Body']
+
     @log_function_execution
     def delete_aws_file(self, file_key: str):
 
@@ -0,0 +1,225 @@
+"""
+Vectors archive format (version 1), all integers little-endian:
+
+    header: MAGIC (8 bytes) | version (u16) | dtype code (u8) | dimension (u32)
+    block:  count (u32) | metadata length (u32)
+            | count x dimension matrix of dtype
+            | zlib-compressed JSON list of [id, metadata] pairs
+    end:    a block with count == 0
+
+Archives written before this format are gzipped JSON lists of vectors, and are
+still read transparently by `iter_vector_archive`.
+"""
+
+# Built-in modules
+import io
+import os
+import json
+import gzip
+import zlib
+import struct
+from typing import Iterator
+
+# 3rd part modules
+import numpy as np
+
+VECTOR_ARCHIVE_MAGIC = b"MAIAVEC\x00"
+VECTOR_ARCHIVE_VERSION = 1
+VECTOR_ARCHIVE_DTYPE = os.getenv("VECTOR_ARCHIVE_DTYPE", "float32")
+VECTOR_ARCHIVE_BLOCK_SIZE = 256
+
+GZIP_MAGIC = b"\x1f\x8b"
+READ_CHUNK_SIZE = 1024 * 1024
+
+_HEADER = struct.Struct("<HBI")
+_BLOCK = struct.Struct("<II")
+_DTYPE_CODES = {"float32": 1, "float16": 2}
+_DTYPES = {code: np.dtype(name).newbyteorder("<") for name, code in _DTYPE_CODES.items()}
+
+
+class VectorArchiveWriter(object):
+    """
+    Incrementally writes vectors to a binary archive.
+
+    Vectors are buffered and written in blocks of VECTOR_ARCHIVE_BLOCK_SIZE, so
+    only one block is held in memory at a time. `close` must be called to write
+    the end marker.
+    """
+    def __init__(self, fileobj, dtype: str = VECTOR_ARCHIVE_DTYPE, block_size: int = VECTOR_ARCHIVE_BLOCK_SIZE) -> None:
+        self.fileobj = fileobj
+        self.dtype_code = _DTYPE_CODES[dtype]
+        self.block_size = block_size
+        self.dimension = None
+        self.buffer = []
+        self.count = 0
+
+    def _write_header(self, dimension: int) -> None:
+        self.dimension = dimension
+        self.fileobj.write(VECTOR_ARCHIVE_MAGIC)
+        self.fileobj.write(_HEADER.pack(VECTOR_ARCHIVE_VERSION, self.dtype_code, dimension))
+
+    def write(self, vectors: list[dict]) -> None:
+        for vector in vectors:
+            if self.dimension is None:
+                self._write_header(len(vector['values']))
+            elif len(vector['values']) != self.dimension:
+                raise ValueError(f"VectorArchiveWriter: expected dimension {self.dimension}, got {len(vector['values'])}")
+            self.buffer.append(vector)
+            if len(self.buffer) >= self.block_size:
+                self._write_block()
+
+    def _write_block(self) -> None:
+        if not self.buffer:
+            return
+        matrix = np.asarray([vector['values'] for vector in self.buffer], dtype=_DTYPES[self.dtype_code])
+        metadata = zlib.compress(json.dumps([[vector['id'], vector.get('metadata', {})] for vector in self.buffer],
+                                            separators=(',', ':')).encode('utf-8'))
+        self.fileobj.write(_BLOCK.pack(len(self.buffer), len(metadata)))
+        self.fileobj.write(matrix.tobytes())
+        self.fileobj.write(metadata)
+        self.count += len(self.buffer)
+        self.buffer = []
+
+    def close(self) -> int:
+        """
+        Flushes the last block and writes the end marker.
+
+        Returns:
+            int: The number of vectors written.
+        """
+        if self.dimension is None:
+            self._write_header(0)
+        self._write_block()
+        self.fileobj.write(_BLOCK.pack(0, 0))
+        return self.count
+
+    def __enter__(self) -> "VectorArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+
+
+def dump_vectors(vectors: list[dict], dtype: str = VECTOR_ARCHIVE_DTYPE) -> bytes:
+    buffer = io.BytesIO()
+    with VectorArchiveWriter(buffer, dtype=dtype) as writer:
+        writer.write(vectors)
+    return buffer.getvalue()
+
+
+def _read_exactly(fileobj, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = fileobj.read(size - len(data))
+        if not chunk:
+            raise ValueError("vector_archive: truncated archive")
+        data += chunk
+    return data
+
+
+def _read_up_to(fileobj, size: int) -> bytes:
+    # Like `_read_exactly`, but a stream ending early is not an error
+    data = b""
+    while len(data) < size:
+        chunk = fileobj.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+class _PrefixedReader(io.RawIOBase):
+    # Puts back the bytes consumed while sniffing the format of a non-seekable stream
+    def __init__(self, prefix: bytes, fileobj) -> None:
+        self.prefix = prefix
+        self.fileobj = fileobj
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.prefix:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        data = self.fileobj.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def iter_json_array(stream, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Incrementally decodes a JSON array of objects from a text stream.
+
+    Only the current read chunk and the object being decoded are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    while True:
+        chunk = stream.read(chunk_size)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','
+                                               or (not started and buffer[position] == '[')):
+                started = started or buffer[position] == '['
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Object continues in the next chunk
+                break
+            yield item
+        buffer = buffer[position:]
+        if not chunk:
+            if buffer.strip():
+                raise ValueError("iter_json_array: truncated JSON array")
+            return
+
+
+def _iter_binary_archive(fileobj) -> Iterator[dict]:
+    version, dtype_code, dimension = _HEADER.unpack(_read_exactly(fileobj, _HEADER.size))
+    if version > VECTOR_ARCHIVE_VERSION:
+        raise ValueError(f"vector_archive: unsupported archive version {version}")
+    dtype = _DTYPES[dtype_code]
+
+    while True:
+        count, metadata_length = _BLOCK.unpack(_read_exactly(fileobj, _BLOCK.size))
+        if count == 0:
+            return
+        matrix = np.frombuffer(_read_exactly(fileobj, count * dimension * dtype.itemsize), dtype=dtype) \
+                   .reshape(count, dimension)
+        metadata = json.loads(zlib.decompress(_read_exactly(fileobj, metadata_length)))
+        for (vector_id, vector_metadata), values in zip(metadata, matrix):
+            yield {"id": vector_id, "values": values.astype(np.float32).tolist(), "metadata": vector_metadata}
+
+
+def iter_vector_archive(fileobj) -> Iterator[dict]:
+    """
+    Streams vectors from an archive, in either the binary or the legacy gzipped JSON format.
+
+    Args:
+        fileobj: A binary file-like object; it does not need to be seekable.
+
+    Yields:
+        dict: Vectors as {"id", "values", "metadata"}, in the order they were written.
+    """
+    # Streams may return short reads, the whole magic is needed to tell the formats apart
+    prefix = _read_up_to(fileobj, len(VECTOR_ARCHIVE_MAGIC))
+    if prefix == VECTOR_ARCHIVE_MAGIC:
+        yield from _iter_binary_archive(fileobj)
+    elif prefix.startswith(GZIP_MAGIC):
+        stream = io.BufferedReader(_PrefixedReader(prefix, fileobj))
+        with gzip.GzipFile(fileobj=stream) as archive:
+            yield from iter_json_array(io.TextIOWrapper(archive, encoding='utf-8'))
+    else:
+        raise ValueError("vector_archive: unknown archive format")
+
+
+def load_vectors(data: bytes) -> list[dict]:
+    return list(iter_vector_archive(io.BytesIO(data)))
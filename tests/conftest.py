@@ -0,0 +1,77 @@
+# Built-in libraries
+import os
+import sys
+
+# 3rd part libraries
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeQuery(object):
+    """
+    The subset of the Supabase query builder used by the code under test, over
+    in-memory rows.
+    """
+    def __init__(self, rows: list[dict]) -> None:
+        self.rows = list(rows)
+
+    def select(self, columns: str) -> "FakeQuery":
+        return self
+
+    def eq(self, column: str, value) -> "FakeQuery":
+        return FakeQuery([row for row in self.rows if row.get(column) == value])
+
+    def lt(self, column: str, value) -> "FakeQuery":
+        return FakeQuery([row for row in self.rows if row[column] < value])
+
+    def order(self, column: str, desc: bool = False) -> "FakeQuery":
+        return FakeQuery(sorted(self.rows, key=lambda row: row[column], reverse=desc))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self.rows[:count])
+
+    def execute(self) -> "FakeResponse":
+        return FakeResponse(self.rows)
+
+
+class FakeResponse(object):
+    # Like postgrest's response, also unpacked as (("data", rows), ("count", None))
+    def __init__(self, data: list[dict]) -> None:
+        self.data = data
+
+    def __iter__(self):
+        return iter([('data', self.data), ('count', None)])
+
+
+class FakeSupabase(object):
+    def __init__(self, tables: dict[str, list[dict]] = None) -> None:
+        self.tables = tables or {}
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self.tables.get(name, []))
+
+
+# Modules bind the Supabase client when imported, so no test ever reaches the real one
+try:
+    from maia.database.supabase import SupabaseClient
+    SupabaseClient._instance = FakeSupabase()
+except ImportError:
+    pass
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """
+    Points every `Redis` connection at one in-memory fakeredis server.
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    from fakeredis import aioredis
+    from maia.database.redis import Redis
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(Redis, "create_connection",
+                        lambda self, **kwargs: fakeredis.FakeStrictRedis(server=server))
+    monkeypatch.setattr(Redis, "create_async_connection",
+                        lambda self, **kwargs: aioredis.FakeRedis(server=server))
+    return server
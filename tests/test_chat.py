@@ -0,0 +1,73 @@
+# 3rd part libraries
+import pytest
+
+pytest.importorskip("supabase")
+pytest.importorskip("pinecone")
+
+# Local libraries
+import maia.src.chat as chat_module
+import maia.src.message as message_module
+from maia.src.chat import Chat
+from maia.src.message import Message
+from conftest import FakeSupabase
+
+USER_ID = "user-1"
+CHAT_ID = "chat-1"
+
+
+def message_row(chat_id: str, seq: int) -> dict:
+    return {'id': f"{chat_id}-{seq}", 'chat_id': chat_id, 'seq': seq, 'role': "user",
+            'content': f"message {seq}", 'created_at': f"2024-01-01T00:00:{seq:02d}"}
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    client = FakeSupabase({
+        'chats': [{'id': CHAT_ID, 'user_id': USER_ID, 'is_archived': False, 'name': "Contrato"}],
+        'chat_messages': [message_row(CHAT_ID, seq) for seq in range(1, 8)] + [message_row("chat-2", 1)],
+    })
+    monkeypatch.setattr(chat_module, "supabase_client", client)
+    monkeypatch.setattr(message_module, "supabase_client", client)
+    return client
+
+
+def seqs(page: dict) -> list[int]:
+    return [message['seq'] for message in page['messages']]
+
+
+def test_pages_go_back_with_the_before_seq_cursor(supabase):
+    chat = Chat(USER_ID, CHAT_ID)
+
+    first = chat.get_messages(limit=3)
+    second = chat.get_messages(before_seq=first['before_seq'], limit=3)
+    last = chat.get_messages(before_seq=second['before_seq'], limit=3)
+
+    assert (seqs(first), first['before_seq']) == ([5, 6, 7], 5)
+    assert (seqs(second), second['before_seq']) == ([2, 3, 4], 2)
+    assert (seqs(last), last['before_seq']) == ([1], None)
+
+
+def test_a_page_holding_the_oldest_message_has_no_cursor(supabase):
+    page = Chat(USER_ID, CHAT_ID).get_messages(limit=7)
+
+    assert (seqs(page), page['before_seq']) == ([1, 2, 3, 4, 5, 6, 7], None)
+
+
+def test_get_one_returns_the_latest_page(supabase):
+    chat = Chat(USER_ID, CHAT_ID).get_one(limit=2)
+
+    assert chat['name'] == "Contrato"
+    assert (seqs(chat), chat['before_seq']) == ([6, 7], 6)
+    assert chat['messages'][0] == {'id': f"{CHAT_ID}-6", '_id': "6", 'seq': 6, 'role': "user",
+                                   'content': "message 6", 'created_at': "2024-01-01T00:00:06"}
+
+
+def test_other_users_chats_are_not_found(supabase):
+    assert Chat("user-2", CHAT_ID).get_messages() is None
+    assert Chat("user-2", CHAT_ID).get_one() is None
+
+
+def test_get_chat_messages_without_limit_returns_the_whole_chat(supabase):
+    messages = Message().get_chat_messages(CHAT_ID)
+
+    assert [message['seq'] for message in messages] == [1, 2, 3, 4, 5, 6, 7]
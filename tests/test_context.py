@@ -0,0 +1,106 @@
+# Built-in libraries
+import os
+
+# 3rd part libraries
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+# Local libraries
+from maia.src.rate_limiter import PRIORITY_INTERACTIVE
+from maia.engines.embeddings import count_tokens
+from maia.engines.context import compact_context
+
+DIMENSION = 4
+
+
+class RecordingBackend(object):
+    # Embeds every text as the same vector and records the calls
+    def __init__(self) -> None:
+        self.calls = []
+
+    def embed_documents(self, texts: list[str], priority: str = None) -> list[list[float]]:
+        self.calls.append(('embed_documents', len(texts), priority))
+        return [[1.0] + [0.0] * (DIMENSION - 1) for _ in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.calls.append(('embed_query', 1, None))
+        return [1.0] + [0.0] * (DIMENSION - 1)
+
+
+def read_only_matrix(tmp_path, rows: list[list[float]]) -> np.ndarray:
+    # Stored vectors come back from the local index as rows of a read-only memory map
+    path = os.path.join(tmp_path, "vectors.npy")
+    np.save(path, np.asarray(rows, dtype=np.float32))
+    return np.load(path, mmap_mode='r')
+
+
+@pytest.fixture
+def candidates(tmp_path):
+    docs = [
+        Document(page_content="O prazo de entrega é de 30 dias.", metadata={'page_number': 1}),
+        Document(page_content="O prazo de entrega é de 30 dias.", metadata={'page_number': 7}),
+        Document(page_content="O prazo de entrega é de trinta dias.", metadata={'page_number': 2}),
+        Document(page_content="A multa por atraso é de 2% ao mês.", metadata={'page_number': 3}),
+    ]
+    matrix = read_only_matrix(tmp_path, [
+        [1.0, 0.1, 0.0, 0.0],
+        [1.0, 0.1, 0.0, 0.0],
+        [1.0, 0.1, -0.01, 0.0],
+        [0.6, 0.0, 0.8, 0.0],
+    ])
+    query_embedding = np.array([1.0, 0.2, 0.3, 0.0], dtype=np.float32)
+    query_embedding.flags.writeable = False
+    return docs, matrix, query_embedding
+
+
+def test_read_only_vectors_are_used_without_writing_to_them(candidates):
+    docs, matrix, query_embedding = candidates
+    original_matrix = np.array(matrix)
+    original_query_embedding = np.array(query_embedding)
+    backend = RecordingBackend()
+
+    selected, compaction = compact_context("Qual o prazo?", docs, backend, token_budget=None,
+                                           embeddings=list(matrix), query_embedding=query_embedding)
+
+    assert backend.calls == []
+    np.testing.assert_array_equal(matrix, original_matrix)
+    np.testing.assert_array_equal(query_embedding, original_query_embedding)
+    # The exact and the near duplicate are dropped, the best match comes first
+    assert [doc.metadata['page_number'] for doc in selected] == [1, 3]
+    assert compaction['retrieved_chunks'] == 4
+    assert compaction['duplicate_chunks'] == 2
+
+
+def test_token_budget_keeps_the_best_chunks(candidates):
+    docs, matrix, query_embedding = candidates
+
+    selected, compaction = compact_context("Qual o prazo?", docs, RecordingBackend(),
+                                           token_budget=count_tokens(docs[0].page_content),
+                                           embeddings=list(matrix), query_embedding=query_embedding)
+
+    assert [doc.metadata['page_number'] for doc in selected] == [1]
+    assert compaction['context_tokens'] == count_tokens(docs[0].page_content)
+
+
+def test_missing_vectors_are_embedded_as_interactive_requests(candidates):
+    docs, matrix, query_embedding = candidates
+    backend = RecordingBackend()
+
+    compact_context("Qual o prazo?", docs, backend, token_budget=None,
+                    embeddings=list(matrix[:3]) + [None], query_embedding=query_embedding)
+
+    assert backend.calls == [('embed_documents', 3, PRIORITY_INTERACTIVE)]
+
+
+def test_embedding_failure_keeps_retrieval_order(candidates):
+    docs, _, _ = candidates
+
+    class FailingBackend(RecordingBackend):
+        def embed_documents(self, texts, priority=None):
+            raise RuntimeError("embedding service unavailable")
+
+    selected, compaction = compact_context("Qual o prazo?", docs, FailingBackend(), token_budget=None)
+
+    assert [doc.metadata['page_number'] for doc in selected] == [1, 2, 3]
+    assert compaction['duplicate_chunks'] == 1
@@ -0,0 +1,57 @@
+# 3rd part libraries
+import pytest
+from langchain.schema import Document
+
+pytest.importorskip("supabase")
+pytest.importorskip("pinecone")
+
+# Local libraries
+from maia.engines.query import fuse_matches, MULTI_QUERY_RRF_K
+
+
+def make_matches(namespace: str, scores: list[float]) -> list[tuple]:
+    return [(Document(page_content=f"{namespace} chunk {rank}", metadata={'page_number': rank}), score, [float(rank)])
+            for rank, score in enumerate(scores)]
+
+
+def contents(fused: list[tuple]) -> list[str]:
+    return [doc.page_content for _, doc, _ in fused]
+
+
+def test_matches_are_merged_by_rank_not_by_raw_score():
+    # Scores of different namespaces (or embedding models) are not comparable
+    fused = fuse_matches({
+        'u.a': make_matches('u.a', [0.31, 0.30, 0.29]),
+        'u.b': make_matches('u.b', [0.92, 0.91]),
+    }, k=10)
+
+    assert contents(fused) == ['u.a chunk 0', 'u.b chunk 0', 'u.a chunk 1', 'u.b chunk 1', 'u.a chunk 2']
+    assert [score for score, _, _ in fused] == pytest.approx(
+        [1 / (MULTI_QUERY_RRF_K + rank) for rank in (1, 1, 2, 2, 3)])
+
+
+def test_only_the_best_k_are_kept():
+    fused = fuse_matches({
+        'u.a': make_matches('u.a', [0.9, 0.8, 0.7]),
+        'u.b': make_matches('u.b', [0.9, 0.8, 0.7]),
+    }, k=3)
+
+    assert contents(fused) == ['u.a chunk 0', 'u.b chunk 0', 'u.a chunk 1']
+
+
+def test_documents_are_tagged_with_their_namespace_and_keep_their_vectors():
+    fused = fuse_matches({
+        'u.a': make_matches('u.a', [0.9]),
+        'u.b': make_matches('u.b', [0.8, 0.7]),
+        'u.c': [],
+    }, k=10)
+
+    assert [(doc.metadata['namespace'], doc.metadata['page_number'], vector) for _, doc, vector in fused] == [
+        ('u.a', 0, [0.0]),
+        ('u.b', 0, [0.0]),
+        ('u.b', 1, [1.0]),
+    ]
+
+
+def test_no_matches():
+    assert fuse_matches({'u.a': [], 'u.b': []}) == []
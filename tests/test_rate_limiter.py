@@ -0,0 +1,103 @@
+# Built-in libraries
+import time
+import asyncio
+
+# 3rd part libraries
+import pytest
+
+# Local libraries
+import maia.src.rate_limiter as rate_limiter
+from maia.src.rate_limiter import RateLimiter, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+# fakeredis runs the token bucket Lua script with lupa
+pytest.importorskip("lupa")
+
+
+@pytest.fixture
+def limiter(fake_redis, monkeypatch):
+    monkeypatch.setitem(rate_limiter.RATE_LIMIT_BUDGETS, 'test', {'rpm': 60, 'tpm': 1000})
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_BULK_RESERVE", 0.2)
+    return RateLimiter()
+
+
+def try_acquire(limiter: RateLimiter, tokens: int = 0, priority: str = PRIORITY_INTERACTIVE) -> float:
+    # One pass of the token bucket: the seconds to wait, 0 when the request was admitted
+    return float(limiter.script(keys=[limiter._key('test', "bucket"), limiter._key('test', "interactive_waiters")],
+                                args=limiter._script_args('test', tokens, priority)))
+
+
+def test_interactive_requests_use_the_whole_budget(limiter):
+    assert all(try_acquire(limiter) == 0 for _ in range(60))
+
+    # The bucket refills one request per second
+    assert 0.5 < try_acquire(limiter) <= 1.0
+
+
+def test_bulk_requests_leave_the_reserve_to_interactive_ones(limiter):
+    assert all(try_acquire(limiter, priority=PRIORITY_BULK) == 0 for _ in range(48))
+
+    assert try_acquire(limiter, priority=PRIORITY_BULK) > 0
+    assert try_acquire(limiter, priority=PRIORITY_INTERACTIVE) == 0
+
+
+def test_bulk_requests_yield_to_waiting_interactive_ones(limiter):
+    limiter.connection.zadd(limiter._key('test', "interactive_waiters"), {"waiter": time.time()})
+
+    assert try_acquire(limiter, priority=PRIORITY_BULK) > 0
+    assert try_acquire(limiter, priority=PRIORITY_INTERACTIVE) == 0
+
+
+def test_tokens_per_minute_are_limited(limiter):
+    assert try_acquire(limiter, tokens=600) == 0
+
+    # 200 tokens short, refilled at 1000 per minute
+    assert try_acquire(limiter, tokens=600) == pytest.approx(12, abs=0.1)
+
+
+def test_requests_larger_than_the_budget_are_clamped(limiter):
+    assert limiter._clamp_cost('test', 10 ** 6, PRIORITY_INTERACTIVE) == 1000
+    assert limiter._clamp_cost('test', 10 ** 6, PRIORITY_BULK) == 800
+
+
+def drain(limiter: RateLimiter, requests: int) -> None:
+    for _ in range(requests):
+        try_acquire(limiter)
+
+
+def test_acquire_waits_for_the_refill(limiter, monkeypatch):
+    monkeypatch.setitem(rate_limiter.RATE_LIMIT_BUDGETS, 'test', {'rpm': 120, 'tpm': 0})
+    drain(limiter, 120)
+
+    waited = limiter.acquire('test', 0, PRIORITY_INTERACTIVE)
+
+    assert 0.2 < waited < 1.0
+    assert limiter.connection.zcard(limiter._key('test', "interactive_waiters")) == 0
+
+
+def test_aacquire_waits_for_the_refill_without_blocking_the_loop(limiter, monkeypatch):
+    monkeypatch.setitem(rate_limiter.RATE_LIMIT_BUDGETS, 'test', {'rpm': 120, 'tpm': 0})
+    drain(limiter, 120)
+
+    async def acquire_concurrently():
+        started_at = time.monotonic()
+        waits = await asyncio.gather(*[limiter.aacquire('test', 0, PRIORITY_INTERACTIVE) for _ in range(3)])
+        return waits, time.monotonic() - started_at
+
+    waits, elapsed = asyncio.run(acquire_concurrently())
+
+    # One request refills every 0.5s and the waits overlap
+    assert sorted(waits) == pytest.approx([0.5, 1.0, 1.5], abs=0.3)
+    assert elapsed < 2.0
+
+
+def test_unavailable_redis_admits_immediately(monkeypatch):
+    from maia.database.redis import Redis
+
+    def unreachable(self, **kwargs):
+        raise ConnectionError("unreachable")
+
+    monkeypatch.setattr(Redis, "create_connection", unreachable)
+    limiter = RateLimiter()
+
+    assert limiter.acquire('chat', 10 ** 6, PRIORITY_BULK) == 0.0
+    assert asyncio.run(limiter.aacquire('chat', 10 ** 6, PRIORITY_BULK)) == 0.0
@@ -0,0 +1,104 @@
+# Built-in libraries
+import time
+import threading
+
+# Local libraries
+from maia.src.single_flight import SingleFlight
+
+CALLERS = 6
+
+
+def start_callers(flights: SingleFlight, fn, callers: int = CALLERS) -> tuple[list, list]:
+    """
+    Calls `flights.do("key", fn)` from `callers` threads.
+
+    Returns:
+        tuple: The threads and the list each (result, shared) or raised exception is appended to.
+    """
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(flights.do("key", fn))
+        except Exception as error:
+            outcomes.append(error)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.005)
+
+
+def run_one_flight(flights: SingleFlight, result=None, error: Exception = None) -> tuple[list, list]:
+    # The leader's call blocks until every other caller joined its flight
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(timeout=5)
+        if error is not None:
+            raise error
+        return result
+
+    threads, outcomes = start_callers(flights, fn)
+    wait_until(lambda: flights.get_stats()['coalesced'] == CALLERS - 1)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    return calls, outcomes
+
+
+def test_followers_share_the_leader_result():
+    flights = SingleFlight()
+
+    calls, outcomes = run_one_flight(flights, result={'answer': 42})
+
+    assert len(calls) == 1
+    assert all(result == {'answer': 42} for result, _ in outcomes)
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * (CALLERS - 1)
+    assert flights.get_stats() == {
+        'in_flight': 0,
+        'calls': 1,
+        'coalesced': CALLERS - 1,
+        'coalesced_rate': (CALLERS - 1) / CALLERS,
+    }
+
+
+def test_followers_get_the_leader_exception():
+    flights = SingleFlight()
+
+    calls, outcomes = run_one_flight(flights, error=ValueError("failed"))
+
+    assert len(calls) == 1
+    assert len(outcomes) == CALLERS
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert flights.get_stats()['in_flight'] == 0
+
+
+def test_results_are_not_kept_after_the_call():
+    flights = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return len(calls)
+
+    assert flights.do("key", fn) == (1, False)
+    assert flights.do("key", fn) == (2, False)
+    assert flights.get_stats()['coalesced'] == 0
+
+
+def test_distinct_keys_do_not_coalesce():
+    flights = SingleFlight()
+
+    assert flights.do("a", lambda: "a") == ("a", False)
+    assert flights.do("b", lambda: "b") == ("b", False)
+    assert flights.get_stats()['calls'] == 2
@@ -0,0 +1,88 @@
+# Built-in libraries
+import io
+import gzip
+import json
+
+# 3rd part libraries
+import numpy as np
+import pytest
+
+# Local libraries
+from maia.src.vector_archive import VectorArchiveWriter, dump_vectors, load_vectors, iter_vector_archive
+
+
+class OneByteReader(object):
+    # A non-seekable stream returning at most one byte per read, like a slow S3 body
+    def __init__(self, data: bytes) -> None:
+        self.stream = io.BytesIO(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self.stream.read(1 if size < 0 else min(size, 1))
+
+
+def make_vectors(count: int, dimension: int = 8) -> list[dict]:
+    rng = np.random.default_rng(0)
+    return [{
+        'id': f"id-{i}",
+        'values': rng.normal(size=dimension).astype(np.float32).tolist(),
+        'metadata': {'source': "doc.pdf", 'page_number': i, 'text': f"chunk {i} é"},
+    } for i in range(count)]
+
+
+def test_dump_and_load_round_trip():
+    vectors = make_vectors(10)
+
+    loaded = load_vectors(dump_vectors(vectors))
+
+    assert [vector['id'] for vector in loaded] == [vector['id'] for vector in vectors]
+    assert [vector['metadata'] for vector in loaded] == [vector['metadata'] for vector in vectors]
+    assert [vector['values'] for vector in loaded] == [vector['values'] for vector in vectors]
+
+
+def test_writer_round_trip_across_blocks_from_a_non_seekable_stream():
+    vectors = make_vectors(7)
+    buffer = io.BytesIO()
+    with VectorArchiveWriter(buffer, block_size=3) as writer:
+        writer.write(vectors[:2])
+        writer.write(vectors[2:])
+
+    loaded = list(iter_vector_archive(OneByteReader(buffer.getvalue())))
+
+    assert writer.count == 7
+    assert [vector['id'] for vector in loaded] == [vector['id'] for vector in vectors]
+
+
+def test_float16_round_trip_is_approximate():
+    vectors = make_vectors(4)
+
+    loaded = load_vectors(dump_vectors(vectors, dtype="float16"))
+
+    for original, restored in zip(vectors, loaded):
+        np.testing.assert_allclose(restored['values'], original['values'], rtol=1e-2, atol=1e-3)
+
+
+def test_empty_archive():
+    assert load_vectors(dump_vectors([])) == []
+
+
+def test_legacy_gzipped_json_archive_is_read():
+    vectors = make_vectors(3)
+
+    loaded = list(iter_vector_archive(OneByteReader(gzip.compress(json.dumps(vectors).encode('utf-8')))))
+
+    assert loaded == vectors
+
+
+def test_mismatched_dimension_is_rejected():
+    writer = VectorArchiveWriter(io.BytesIO())
+    writer.write(make_vectors(1, dimension=8))
+
+    with pytest.raises(ValueError):
+        writer.write(make_vectors(1, dimension=4))
+
+
+def test_truncated_archive_is_rejected():
+    data = dump_vectors(make_vectors(3))
+
+    with pytest.raises(ValueError):
+        load_vectors(data[:-12])